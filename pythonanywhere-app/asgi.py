@@ -0,0 +1,383 @@
+# ASGI Entry Point
+# Async serving mode for the OData endpoints. The activities and SampleData
+# entity sets are served natively here, using an aiomysql connection pool, so
+# a slow MySQL query (or SSH tunnel) only parks a coroutine instead of tying up
+# a whole sync worker. Every other route is passed through to the Flask app in
+# server.py unchanged.
+#
+# Activities pages are streamed: rows are read with an unbuffered cursor a
+# batch at a time and encoded as they arrive, so the first bytes go out before
+# the table has been read and memory stays bounded. Requests that need every
+# row first - $orderby, or $count when the count cache can't answer it - are
+# built in memory like the Flask view.
+#
+# The native routes skip Flask's after_request hooks, so they apply the same
+# ETag/If-None-Match and gzip/br handling as http_caching.py themselves (no
+# ETag for streamed bodies, as in Flask), answer $count probes from the entity
+# count cache like the Flask view, and record the same phase, pool and
+# response size metrics.
+#
+# Run with:  uvicorn asgi:app --host 0.0.0.0 --port 8000
+# Requires:  pip install -r requirements.txt (uvicorn, asgiref, aiomysql)
+
+import asyncio
+import hashlib
+import json
+import time
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import parse_etags
+
+from server import app as flask_app
+from db_connection import close_async_db_pool, dispose_db_engines, get_async_db_pool
+from http_caching import DEFAULT_MIN_SIZE, StreamCompressor, best_encoding, compress_stream
+from metrics import POOL_CHECKOUT, REQUEST_LATENCY, RESPONSE_SIZE, observe_phase, record_cache, timed_phase
+from garmin_connect_odata_endpoints.entity_counts import lookup_count, store_count
+from garmin_connect_odata_endpoints.routes import (
+    ACTIVITIES_QUERY, ODataQueryError, apply_filter, apply_select, build_odata_page, next_link,
+    normalize_filter, page_bounds, parse_filter, records_from_dataframe
+)
+from sample_data_odata_endpoints.routes import build_odata_response
+
+# Size of each streamed body chunk
+STREAM_CHUNK_SIZE = 65536
+
+# Rows read from the unbuffered cursor per batch
+STREAM_FETCH_SIZE = 2000
+
+ODATA_HEADERS = [
+    (b'content-type', b'application/json; odata.metadata=minimal'),
+    (b'odata-version', b'4.0'),
+]
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+# ============================================================================
+# HELPERS: Request URLs and query parameters from the ASGI scope
+# ============================================================================
+def _query_args(scope):
+    """Query parameters as a dict (first value wins, like Flask's request.args)"""
+    args = {}
+    for key, value in parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True):
+        args.setdefault(key, value)
+    return args
+
+def _url_root(scope):
+    """Equivalent of Flask's request.url_root"""
+    headers = dict(scope.get('headers', []))
+    host = headers.get(b'host', b'').decode('latin-1')
+    if not host and scope.get('server'):
+        host = f"{scope['server'][0]}:{scope['server'][1]}"
+    return f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}/"
+
+def _header(scope, name):
+    """Request header value ('' if absent)"""
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+def _encode_json(payload):
+    """Response body for a payload
+
+    json.dumps (C encoder) is much faster than streaming with iterencode
+    (pure Python), and the whole body is needed up front for the ETag anyway.
+    """
+    return json.dumps(payload, default=str).encode('utf-8')
+
+async def _send_json(scope, send, body, status=200):
+    """Send a JSON body in chunks, with the ETag/304 and compression handling of http_caching"""
+    headers = list(ODATA_HEADERS)
+    config = flask_app.config
+    encoding = None
+
+    # Same rules as http_caching.compress_and_cache: only 200 responses
+    if status == 200:
+        headers.append((b'vary', b'Accept-Encoding'))
+        if len(body) >= config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE):
+            encoding = best_encoding(_header(scope, b'accept-encoding'))
+
+        # Strong ETag from the uncompressed body, suffixed per coding
+        etag = hashlib.sha1(body).hexdigest()
+        if encoding:
+            etag = f"{etag}-{encoding}"
+        headers.append((b'etag', f'"{etag}"'.encode('latin-1')))
+
+        if_none_match = _header(scope, b'if-none-match')
+        if if_none_match:
+            hit = parse_etags(if_none_match).contains_weak(etag)
+            record_cache('http_etag', hit)
+            if hit:
+                await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                return
+
+    if encoding:
+        headers.append((b'content-encoding', encoding.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+    chunks = (body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE))
+    if encoding:
+        chunks = compress_stream(chunks, encoding, config)
+    for chunk in chunks:
+        if chunk:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+class _BodyStream:
+    """Chunked response body: buffers writes up to STREAM_CHUNK_SIZE, compressing if negotiated"""
+
+    def __init__(self, send, encoding):
+        self.send = send
+        self.compressor = StreamCompressor(encoding, flask_app.config) if encoding else None
+        self.buffer = []
+        self.buffered = 0
+
+    async def write(self, text):
+        data = text.encode('utf-8')
+        if self.compressor:
+            data = self.compressor.compress(data)
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= STREAM_CHUNK_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self.buffered:
+            await self.send({'type': 'http.response.body', 'body': b''.join(self.buffer), 'more_body': True})
+        self.buffer = []
+        self.buffered = 0
+
+    async def close(self):
+        if self.compressor:
+            self.buffer.append(self.compressor.finish())
+            self.buffered += len(self.buffer[-1])
+        await self.flush()
+        await self.send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+# ============================================================================
+# NATIVE ASYNC ROUTES: Same OData semantics as the Flask blueprints
+# ============================================================================
+async def _acquire(pool, endpoint):
+    """Check a connection out of the async pool, recording the wait"""
+    start = time.perf_counter()
+    connection = await pool.acquire()
+    POOL_CHECKOUT.observe(time.perf_counter() - start, endpoint=endpoint)
+    return connection
+
+async def _stream_activities(scope, send, args, url_root, count):
+    """Stream a page of activities while reading the table
+
+    Only used without $orderby, and with $count only when `count` came from
+    the count cache, so nothing has to wait for the last row.
+    """
+    import aiomysql
+    import pandas as pd
+
+    endpoint = 'asgi.garmin_activities'
+    # Invalid options are reported (400) before the response starts
+    skip, top = page_bounds(args)
+    clauses = parse_filter(args.get('$filter'))
+    base_url = url_root.rstrip('/') + scope['path']
+
+    head = {"@odata.context": f"{url_root}garmin_activities/$metadata#activities"}
+    if count is not None:
+        head["@odata.count"] = count
+
+    matched = 0
+    sent = 0
+    more = False
+    phases = {'db_query': 0.0, 'transform': 0.0, 'serialization': 0.0}
+
+    # CPU-bound - runs off the event loop, one batch at a time
+    def encode_batch(rows):
+        nonlocal matched, sent, more
+        start = time.perf_counter()
+        data = records_from_dataframe(pd.DataFrame.from_records(rows, coerce_float=True))
+        if clauses:
+            data = apply_filter(data, clauses)
+        if '$select' in args:
+            data = apply_select(data, args['$select'])
+        phases['transform'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        parts = []
+        for record in data:
+            if matched >= skip + top:
+                more = True
+                break
+            if matched >= skip:
+                parts.append((',' if sent else '') + json.dumps(record, default=str))
+                sent += 1
+            matched += 1
+        phases['serialization'] += time.perf_counter() - start
+        return ''.join(parts)
+
+    headers = list(ODATA_HEADERS) + [(b'vary', b'Accept-Encoding')]
+    # Size unknown up front - compress whenever the client accepts it (like Flask's streamed responses)
+    encoding = best_encoding(_header(scope, b'accept-encoding'))
+    if encoding:
+        headers.append((b'content-encoding', encoding.encode('latin-1')))
+
+    pool = await get_async_db_pool()
+    connection = await _acquire(pool, endpoint)
+    try:
+        async with connection.cursor(aiomysql.SSDictCursor) as cursor:
+            start = time.perf_counter()
+            await cursor.execute(ACTIVITIES_QUERY)
+            phases['db_query'] += time.perf_counter() - start
+
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            body = _BodyStream(send, encoding)
+            await body.write(json.dumps(head)[:-1] + ', "value": [')
+
+            # $top=0 only asks for the count
+            while top > 0 and not more:
+                start = time.perf_counter()
+                rows = await cursor.fetchmany(STREAM_FETCH_SIZE)
+                phases['db_query'] += time.perf_counter() - start
+                if not rows:
+                    break
+                await body.write(await asyncio.to_thread(encode_batch, rows))
+    finally:
+        # Closing the cursor above drained any rows left after the last page
+        pool.release(connection)
+
+    # nextLink after the value, as OData JSON allows for streamed collections
+    tail = ']'
+    if more:
+        tail += ', "@odata.nextLink": ' + json.dumps(next_link(args, base_url, skip, top))
+    await body.write(tail + '}')
+    await body.close()
+
+    for phase, seconds in phases.items():
+        observe_phase(phase, seconds, endpoint)
+    print(f"Streamed {sent} records (skip={skip}, top={top})")  # Debug log
+
+async def garmin_activities(scope, send):
+    """Async version of garmin_activities.activities_data"""
+    import aiomysql
+    import pandas as pd
+
+    endpoint = 'asgi.garmin_activities'
+    args = _query_args(scope)
+    url_root = _url_root(scope)
+    count_requested = args.get('$count', '').lower() == 'true'
+    normalized_filter = normalize_filter(args.get('$filter'))
+
+    # The count cache reads odata_entity_counts through the sync engine - keep it off the event loop
+    count = None
+    data_version = None
+    if count_requested:
+        count, data_version = await asyncio.to_thread(lookup_count, 'activities', normalized_filter)
+        # Count probe ($top=0&$count=true) answered without reading the table
+        if count is not None and args.get('$top') == '0':
+            payload = {
+                "@odata.context": f"{url_root}garmin_activities/$metadata#activities",
+                "@odata.count": count,
+                "value": []
+            }
+            return await _send_json(scope, send, _encode_json(payload))
+
+    if '$orderby' not in args and (count is not None or not count_requested):
+        return await _stream_activities(scope, send, args, url_root, count)
+
+    # $orderby or an uncached $count needs every row before the first byte
+    pool = await get_async_db_pool()
+    connection = await _acquire(pool, endpoint)
+    try:
+        with timed_phase('db_query', endpoint):
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(ACTIVITIES_QUERY)
+                rows = await cursor.fetchall()
+    finally:
+        pool.release(connection)
+
+    # Converting rows and encoding the body is CPU-bound - keep it off the event loop
+    def build_body():
+        with timed_phase('transform', endpoint):
+            df = pd.DataFrame.from_records(rows, coerce_float=True)
+            data = records_from_dataframe(df)
+            base_url = url_root.rstrip('/') + scope['path']
+            odata_response = build_odata_page(data, args, base_url, url_root)
+        if count_requested:
+            store_count('activities', data_version, normalized_filter, odata_response["@odata.count"])
+        with timed_phase('serialization', endpoint):
+            return _encode_json(odata_response)
+
+    body = await asyncio.to_thread(build_body)
+    await _send_json(scope, send, body)
+
+async def sample_data(scope, send):
+    """Async version of sample_data.sample_data"""
+    with timed_phase('transform', 'asgi.sample_data'):
+        payload = build_odata_response(_query_args(scope), _url_root(scope))
+    with timed_phase('serialization', 'asgi.sample_data'):
+        body = _encode_json(payload)
+    await _send_json(scope, send, body)
+
+NATIVE_ROUTES = {
+    '/garmin_activities/activities': ('asgi.garmin_activities', garmin_activities),
+    '/sample_data/SampleData': ('asgi.sample_data', sample_data),
+}
+
+# ============================================================================
+# ASGI APP: Dispatch native routes, hand everything else to Flask
+# ============================================================================
+async def _lifespan(receive, send):
+    """Close the database pools on shutdown"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_db_pool()
+            dispose_db_engines()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    route = NATIVE_ROUTES.get(scope.get('path')) if scope['type'] == 'http' else None
+    if route is None or scope.get('method') != 'GET':
+        return await wsgi_app(scope, receive, send)
+
+    endpoint, handler = route
+    start = time.perf_counter()
+    status = 200
+    response_started = False
+    response_size = 0
+
+    async def tracking_send(message):
+        nonlocal response_started, status, response_size
+        if message['type'] == 'http.response.start':
+            response_started = True
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            response_size += len(message.get('body', b''))
+        await send(message)
+
+    try:
+        await handler(scope, tracking_send)
+    except ODataQueryError as e:
+        # Unsupported query option (e.g. $filter) - the client's error
+        status = 400
+        if response_started:
+            raise
+        await _send_json(scope, tracking_send, _encode_json({"error": str(e)}), status=status)
+    except Exception as e:
+        print(f"Error in {endpoint} endpoint: {str(e)}")  # Debug log
+        import traceback
+        traceback.print_exc()
+        status = 500
+        # Too late for an error body once streaming has begun
+        if response_started:
+            raise
+        await _send_json(scope, tracking_send, _encode_json({"error": str(e)}), status=status)
+    finally:
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=scope['method'], status=status)
+        # Bytes as sent (after compression), like the Flask path
+        RESPONSE_SIZE.observe(response_size, endpoint=endpoint)
@@ -0,0 +1,321 @@
+# COVID Dataset Refresher
+# Keeps the Johns Hopkins datasets (confirmed cases and deaths) in memory so
+# requests never pay for the download/parse. A background thread per worker
+# loads them at startup and re-checks upstream every COVID_REFRESH_SECONDS
+# (conditional GET, so an unchanged file costs one 304). New versions are
+# swapped in atomically.
+#
+# Workers coordinate through a file lock in COVID_CACHE_DIR: whichever worker
+# holds the lock downloads and writes an .npz copy of the parsed dataset;
+# the others just load that copy. The copy holds plain arrays only (loaded
+# with allow_pickle=False) and the directory is private to the app's user,
+# so nothing in it can run code in a worker.
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import record_cache
+
+# fcntl is POSIX only - without it (local Windows dev) every worker downloads
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Johns Hopkins time series (COVID_CONFIRMED_URL / COVID_DEATHS_URL may point at local CSVs instead)
+JHU_TIME_SERIES = (
+    "https://raw.githubusercontent.com"
+    "/CSSEGISandData/COVID-19/master"
+    "/csse_covid_19_data/csse_covid_19_time_series"
+)
+SOURCES = {
+    'cases': os.getenv('COVID_CONFIRMED_URL', f"{JHU_TIME_SERIES}/time_series_covid19_confirmed_US.csv"),
+    'deaths': os.getenv('COVID_DEATHS_URL', f"{JHU_TIME_SERIES}/time_series_covid19_deaths_US.csv"),
+}
+
+# Metrics the graph can show (keys of CovidData.series)
+METRICS = {'cases': 'New Cases', 'deaths': 'New Deaths'}
+
+# Text columns of CovidData.counties
+TEXT_COLUMNS = ["County", "State", "Combined_Key"]
+
+# Non-date columns of the JHU US time series files
+ID_COLUMNS = ["UID","iso2","iso3","code3","FIPS","Admin2","Province_State","Country_Region","Lat","Long_","Combined_Key","Population"]
+
+REFRESH_INTERVAL = int(os.getenv('COVID_REFRESH_SECONDS', 3600))
+CACHE_DIR = os.getenv('COVID_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'covid-by-county'))
+
+# Bump when the cached dataset changes shape so old cache files are rebuilt
+CACHE_FORMAT = 3
+
+# (version, CovidData) - replaced in one assignment, never mutated
+_current = None
+# (version, JSON bytes) of the state -> counties index for the current version
+_locations_index = None
+_load_lock = threading.Lock()
+_refresher_pid = None
+
+def _cache_path(name):
+    return os.path.join(CACHE_DIR, name)
+
+def _ensure_cache_dir():
+    """Create the cache directory (owner-only) and refuse one owned by another user"""
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid') and os.stat(CACHE_DIR).st_uid != os.getuid():
+        raise PermissionError(f"COVID cache directory {CACHE_DIR} is owned by another user")
+
+@contextmanager
+def _worker_lock():
+    """Exclusive lock shared by every worker process on this machine"""
+    _ensure_cache_dir()
+    with open(_cache_path('refresh.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _read_meta():
+    try:
+        with open(_cache_path('meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_atomic(name, data):
+    """Write a cache file so readers never see a partial copy"""
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, _cache_path(name))
+
+class CovidData:
+    """Columnar store for every metric
+
+    `counties` (State, County, Combined_Key, Population) is one index shared by
+    all metrics: row i of `counties` is row i of each matrix in `series`. The
+    matrices hold cumulative counts, one column per day in `dates`.
+    """
+
+    def __init__(self, counties, dates, series):
+        self.counties = counties
+        self.dates = dates
+        self.series = series
+
+    def select(self, state, counties):
+        """Row positions of the given counties in a state"""
+        import numpy as np
+
+        mask = (self.counties["State"] == state) & self.counties["County"].isin(counties)
+        return np.flatnonzero(mask.to_numpy())
+
+    def daily_series(self, rows, metric='cases', per_100k=False, rolling=None):
+        """Daily values of a metric for the given rows, one column per county
+
+        Everything is computed on the (counties x dates) matrix at once, so the
+        cost doesn't grow with a per-county loop.
+        """
+        import numpy as np
+        import pandas as pd
+
+        cumulative = self.series[metric][rows].astype(np.float64)
+
+        # Day-over-day differences (the first day has no previous value)
+        daily = np.full(cumulative.shape, np.nan)
+        daily[:, 1:] = np.diff(cumulative, axis=1)
+
+        if per_100k:
+            population = self.counties["Population"].to_numpy(dtype=np.float64)[rows]
+            population[population <= 0] = np.nan
+            daily = daily / population[:, None] * 100000
+
+        df = pd.DataFrame(daily.T, index=self.dates, columns=self.counties["Combined_Key"].to_numpy()[rows])
+        if rolling and rolling > 1:
+            df = df.rolling(rolling, min_periods=1).mean()
+        return df
+
+    def to_npz(self):
+        """Serialize to .npz bytes (plain arrays, no pickled objects)"""
+        import numpy as np
+
+        buffer = io.BytesIO()
+        arrays = {
+            f"counties_{column}": self.counties[column].fillna('').to_numpy(dtype=str)
+            for column in TEXT_COLUMNS
+        }
+        arrays['counties_Population'] = self.counties["Population"].to_numpy(dtype=np.float64)
+        arrays['dates'] = self.dates.to_numpy(dtype='datetime64[ns]')
+        for metric, matrix in self.series.items():
+            arrays[f"series_{metric}"] = matrix
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_npz(cls, path):
+        """Load a dataset written by to_npz"""
+        import numpy as np
+        import pandas as pd
+
+        with np.load(path, allow_pickle=False) as arrays:
+            counties = pd.DataFrame({
+                column: pd.Series(arrays[f"counties_{column}"].tolist()).replace('', np.nan)
+                for column in TEXT_COLUMNS
+            })
+            counties["Population"] = arrays['counties_Population']
+            series = {
+                name[len('series_'):]: arrays[name]
+                for name in arrays.files if name.startswith('series_')
+            }
+            return cls(counties, pd.DatetimeIndex(arrays['dates']), series)
+
+def parse_data(contents):
+    """Parse the raw CSVs into one CovidData aligned on county (UID) and date"""
+    import numpy as np
+    import pandas as pd
+
+    frames = {name: pd.read_csv(io.BytesIO(content)) for name, content in contents.items()}
+
+    # Only the deaths file carries Population - share it across metrics by UID
+    counties = frames['cases'][["UID","Admin2","Province_State","Combined_Key"]].set_index("UID")
+    counties["Population"] = frames['deaths'].set_index("UID")["Population"].reindex(counties.index)
+    counties.rename(columns = {"Admin2":"County","Province_State":"State"}, inplace = True)
+
+    # Dates present in every file, in calendar order
+    date_columns = [c for c in frames['cases'].columns if c not in ID_COLUMNS]
+    for df in frames.values():
+        date_columns = [c for c in date_columns if c in df.columns]
+
+    series = {
+        name: df.set_index("UID").reindex(counties.index)[date_columns].fillna(0).to_numpy(dtype=np.int32)
+        for name, df in frames.items()
+    }
+
+    return CovidData(
+        counties.reset_index(drop=True),
+        pd.to_datetime(date_columns, format="%m/%d/%y"),
+        series
+    )
+
+def _fetch_if_changed(url, meta):
+    """Return (CSV bytes or None if unchanged since `meta`, new meta)"""
+    if not url.startswith(('http://', 'https://')):
+        mtime = os.path.getmtime(url)
+        if meta.get('source_mtime') == mtime:
+            return None, meta
+        with open(url, 'rb') as f:
+            return f.read(), {'source_mtime': mtime}
+
+    import requests
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    response = requests.get(url, headers=headers, timeout=60)
+    if response.status_code == 304:
+        return None, meta
+    response.raise_for_status()
+    return response.content, {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+def refresh(force=False):
+    """Bring this worker's dataset up to date (downloading only if it's stale)"""
+    global _current
+
+    with _worker_lock():
+        meta = _read_meta()
+        if meta.get('format') != CACHE_FORMAT:
+            meta = {}
+        stale = force or not meta.get('version') or time.time() - meta.get('checked_at', 0) >= REFRESH_INTERVAL
+        if stale:
+            sources_meta = meta.get('sources', {})
+            contents = {}
+            new_sources_meta = {}
+            for name, url in SOURCES.items():
+                contents[name], new_sources_meta[name] = _fetch_if_changed(url, sources_meta.get(name, {}))
+
+            # Any change means a rebuild, which needs every file
+            if any(content is not None for content in contents.values()):
+                for name, url in SOURCES.items():
+                    if contents[name] is None:
+                        contents[name], new_sources_meta[name] = _fetch_if_changed(url, {})
+                data = parse_data(contents)
+                _write_atomic('dataset.npz', data.to_npz())
+                digest = hashlib.sha1()
+                for name in sorted(contents):
+                    digest.update(contents[name])
+                meta = {'format': CACHE_FORMAT, 'sources': new_sources_meta, 'version': digest.hexdigest()[:12]}
+                print(f"COVID dataset downloaded (version {meta['version']}, {len(data.counties)} counties)")  # Debug log
+            meta['checked_at'] = time.time()
+            _write_atomic('meta.json', json.dumps(meta).encode('utf-8'))
+
+        # Pick up whatever version is on disk, possibly written by another worker
+        if _current is None or _current[0] != meta['version']:
+            _current = (meta['version'], CovidData.from_npz(_cache_path('dataset.npz')))
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh()
+        except Exception as e:
+            # Keep serving the last good version
+            print(f"Error refreshing COVID dataset: {str(e)}")  # Debug log
+        time.sleep(REFRESH_INTERVAL)
+
+def start_refresher():
+    """Start the background refresher for this worker process (idempotent)"""
+    global _refresher_pid
+
+    # Threads don't survive a fork, so each worker (pid) starts its own
+    with _load_lock:
+        if _refresher_pid == os.getpid():
+            return
+        _refresher_pid = os.getpid()
+    threading.Thread(target=_refresh_loop, name='covid-refresher', daemon=True).start()
+
+def get_dataset():
+    """Return (version, CovidData) - treat it as read-only"""
+    start_refresher()
+
+    current = _current
+    record_cache('covid_dataset', current is not None)
+    if current is None:
+        # Only the very first request(s) of a worker wait for the initial load
+        with _load_lock:
+            if _current is None:
+                refresh()
+        current = _current
+    return current
+
+def build_locations_index(data):
+    """States and their counties, in dataset order, as JSON bytes"""
+    df = data.counties
+    counties = df.dropna(subset=["County"]).groupby("State", sort=False)["County"].agg(list)
+    index = {
+        "states": list(df["State"].unique()),
+        "counties": counties.to_dict(),
+    }
+    return json.dumps(index, separators=(',', ':')).encode('utf-8')
+
+def get_locations_index():
+    """Return (version, JSON bytes) of the state -> counties index, built once per version"""
+    global _locations_index
+
+    version, data = get_dataset()
+    cached = _locations_index
+    record_cache('covid_locations_index', cached is not None and cached[0] == version)
+    if cached is None or cached[0] != version:
+        cached = (version, build_locations_index(data))
+        _locations_index = cached
+    return cached
@@ -0,0 +1,83 @@
+# COVID Series Downsampling
+# Reduces a daily series to roughly one point per pixel of the chart before it
+# is serialized into graphJSON, so the payload stays bounded however long the
+# date range or however many counties are compared.
+#
+#   lttb    -> Largest-Triangle-Three-Buckets: keeps the visually significant
+#              points (peaks, troughs, turns) of a line
+#   minmax  -> the min and max of each bucket: never hides a spike
+
+import numpy as np
+
+# Smallest/largest chart widths (pixels) honoured by the graph endpoint
+MIN_WIDTH = 100
+MAX_WIDTH = 4000
+
+def lttb(x, y, threshold):
+    """Indices of `threshold` points chosen by Largest-Triangle-Three-Buckets"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # First and last points are fixed; the rest are split into equal buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    # x as float so the triangle areas work for datetimes too. The average of
+    # each bucket (the third vertex for the bucket before it) is computed up
+    # front; the last bucket's "next" average is the final point.
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    counts = np.diff(np.append(edges, n))
+    avg_x = (np.add.reduceat(x, edges) / counts).tolist()[1:]
+    avg_y = (np.add.reduceat(y, edges) / counts).tolist()[1:]
+
+    # Buckets hold only a few points at chart resolution, where plain Python
+    # beats per-bucket numpy calls
+    xs, ys, bounds = x.tolist(), y.tolist(), edges.tolist()
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        ax, ay, cx, cy = xs[a], ys[a], avg_x[i], avg_y[i]
+        best_area = -1.0
+        for j in range(bounds[i], bounds[i + 1]):
+            area = abs((ax - cx) * (ys[j] - ay) - (ax - xs[j]) * (cy - ay))
+            if area > best_area:
+                best_area = area
+                a = j
+        keep.append(a)
+    keep.append(n - 1)
+    return np.array(keep, dtype=np.int64)
+
+def minmax(y, buckets):
+    """Indices of the min and max point of each of `buckets` equal buckets, in order"""
+    n = len(y)
+    if buckets * 2 >= n or buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    keep = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        bucket = y[start:end]
+        keep.extend(sorted({start + int(np.argmin(bucket)), start + int(np.argmax(bucket))}))
+    return np.array(keep, dtype=np.int64)
+
+def downsample(dates, values, width, method='lttb'):
+    """Downsample one series to fit `width` pixels, returning (dates, values)
+
+    NaN days (e.g. the first day, which has no difference) are dropped first.
+    """
+    valid = ~np.isnan(values)
+    dates, values = dates[valid], values[valid]
+
+    if method == 'minmax':
+        # Two points per bucket
+        keep = minmax(values, width // 2)
+    else:
+        keep = lttb(dates.asi8, values, width)
+    return dates[keep], values[keep]
+
+def weekly(df):
+    """Weekly totals of a daily frame (weeks ending Sunday)"""
+    return df.resample('W').sum(min_count=1)
@@ -1,81 +1,129 @@
 # COVID by County Blueprint
 # This project displays COVID-19 case data by county using data from Johns Hopkins CSSE
+#
+# requests/pandas/plotly are imported on first use (see warm_up) so loading the
+# app doesn't pay for them until this blueprint is actually hit. The dataset
+# itself is kept in memory and refreshed in the background (see dataset.py).
 
-import io
 import json
-import requests
-import pandas as pd
-import plotly
-import plotly.express as px
-from flask import Blueprint, render_template, request
+from flask import Blueprint, Response, redirect, render_template, request, url_for
+from metrics import timed_phase
+from covid_by_county.dataset import METRICS, get_dataset, get_locations_index, start_refresher
 
-# Create blueprint with its own templates and static folders
+# Create blueprint with its own templates folder
 covid_bp = Blueprint(
     'covid', 
     __name__, 
     url_prefix='/covid-by-county',
-    template_folder='templates',
-    static_folder='static'
+    template_folder='templates'
 )
 
-def pull_data():
-    """Pull COVID-19 data from Johns Hopkins GitHub repository"""
-    url = (
-        "https://raw.githubusercontent.com"
-        "/CSSEGISandData/COVID-19/master"
-        "/csse_covid_19_data/csse_covid_19_time_series"
-        "/time_series_covid19_confirmed_US.csv"
-    )
-    download = requests.get(url).content
-    df = pd.read_csv(io.StringIO(download.decode('utf-8')))
+# Allowed values of the graph's freq and downsample parameters
+FREQUENCIES = ('daily', 'weekly')
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
 
-    df.drop(columns=["UID","iso2","iso3","code3","FIPS","Country_Region","Lat","Long_"], inplace=True)
-    df.rename(columns = {"Admin2":"County","Province_State":"State"}, inplace = True)
+# The locations index URL changes with every dataset version, so it can be cached forever
+IMMUTABLE_MAX_AGE = 31536000
 
-    return df
+# Load the dataset as soon as the blueprint is registered, not on the first request
+covid_bp.record_once(lambda state: start_refresher())
+
+def warm_up():
+    """Import the heavy dependencies ahead of the first request"""
+    import requests
+    import pandas
+    import plotly.graph_objects
 
 @covid_bp.route("/")
 def covid_by_county():
     """Main COVID by County page"""
-    # Pull the data and list all locations
-    df = pull_data()
-    locations = df["Combined_Key"].to_list()
-    states = list(df["State"].unique())
+    # Get the in-memory data and list all states
+    with timed_phase('data_load'):
+        version, data = get_dataset()
+    states = list(data.counties["State"].unique())
+    locations_url = url_for('covid.locations_index', version=version)
 
     # Return covid-by-county.html
-    return render_template("covid-by-county.html", states = states, list = locations)
+    with timed_phase('render'):
+        return render_template("covid-by-county.html", states = states, locations_url = locations_url, metrics = METRICS)
+
+@covid_bp.route("/locations/<version>.json")
+def locations_index(version):
+    """State -> counties index for the county dropdown (versioned, immutable)"""
+    current_version, index = get_locations_index()
+
+    # Pages rendered before a refresh still point at the old version
+    if version != current_version:
+        return redirect(url_for('covid.locations_index', version=current_version))
+
+    response = Response(index, mimetype='application/json')
+    response.set_etag(current_version)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
 
 @covid_bp.route("/graph")
 def covid_by_county_graph():
     """Generate COVID graph based on selected county and state"""
-    # Pull the data and list all locations
-    df = pull_data()
-    locations = df["Combined_Key"].to_list()
-    states = list(df["State"].unique())
+    import plotly
+    import plotly.graph_objects as go
+    from covid_by_county.downsample import MAX_WIDTH, MIN_WIDTH, downsample, weekly
+
+    # Get the in-memory data and list all states
+    with timed_phase('data_load'):
+        version, data = get_dataset()
+    states = list(data.counties["State"].unique())
+    locations_url = url_for('covid.locations_index', version=version)
 
-    # Filter data (based off of query string, args is a list of
-    # parameters in the query string)
+    # Filter data (based off of query string). Counties can be repeated
+    # (county=A&county=B) or given in the legacy quoted form (A','B)
     args = request.args
-    county = args["county"] # str(x).lstrip('[').rstrip(']'), where x is a python list
     state = args["state"]
-    expr = f"County in ('{county}') and State == '{state}'"
-    df.query(expr = expr, inplace = True)
-    row_count = len(df.index)
+    counties = [c for value in args.getlist("county") for c in value.split("','")]
+    metric = args.get("metric", "cases")
+    freq = args.get("freq", "daily")
+    method = args.get("downsample", "lttb")
+    for name, value, allowed in (("metric", metric, METRICS), ("freq", freq, FREQUENCIES), ("downsample", method, DOWNSAMPLE_METHODS)):
+        if value not in allowed:
+            return Response(
+                json.dumps({"error": f"Unknown {name} '{value}' (expected one of: {', '.join(allowed)})"}),
+                status=400,
+                mimetype='application/json'
+            )
+    per_100k = args.get("per_100k", "false").lower() in ("1", "true", "yes", "on")
+    rolling = args.get("rolling", type=int)
+    # Weekly totals are already smoothed - summing a rolling average would mean nothing
+    if freq == "weekly":
+        rolling = None
+    # Chart width in pixels - the series is downsampled to about one point per pixel
+    width = args.get("width", type=int)
+    if width is not None:
+        width = min(max(width, MIN_WIDTH), MAX_WIDTH)
 
-    # Format the dataframe
-    df.drop(columns = ["County","State"],inplace = True)
-    df = df.T
-    new_header = df.iloc[0] # grab the first row for the header
-    df = df[1:] # take the data less the header row
-    df.columns = new_header # set the header row as the df header
+    with timed_phase('transform'):
+        rows = data.select(state, counties)
+        df = data.daily_series(rows, metric=metric, per_100k=per_100k, rolling=rolling)
+        if freq == "weekly":
+            df = weekly(df)
 
-    # Calculate the differences
-    for i in range(row_count):
-        df.iloc[:,i] = df.iloc[:,i].diff(1)
+        # One trace per county (downsampling picks different dates per county)
+        traces = []
+        for county in df.columns:
+            dates, values = df.index, df[county].to_numpy()
+            if width is not None:
+                dates, values = downsample(dates, values, width, method)
+            traces.append(go.Scatter(x=dates, y=values, mode="lines", name=county))
 
     # Graph
-    fig = px.line(df)
-    graphJSON = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+    with timed_phase('serialization'):
+        title = (METRICS[metric] + (" per 100k" if per_100k else "")
+                 + (f" ({rolling}-day average)" if rolling and rolling > 1 else "")
+                 + (", weekly totals" if freq == "weekly" else ""))
+        fig = go.Figure(traces)
+        fig.update_layout(title=title, xaxis_title="Date", yaxis_title=title, legend_title_text="County")
+        graphJSON = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
     # Return template and data
-    return render_template("covid-by-county.html", list=locations, states = states, graphJSON=graphJSON)
+    with timed_phase('render'):
+        return render_template("covid-by-county.html", locations_url = locations_url, states = states, metrics = METRICS, graphJSON=graphJSON)
@@ -0,0 +1,97 @@
+# Entity Count Cache
+# Read-through cache of $count results for the Garmin entity sets, so count
+# probes (Tableau sends $top=0&$count=true and /$count constantly) don't load
+# and count the whole table.
+#
+# The ETL publishes each entity set's row count and a data_version to the
+# odata_entity_counts table after every load (scheduled_tasks/odata_counts.py).
+# That table is re-read at most every ODATA_COUNT_VERSION_TTL seconds. The
+# unfiltered count comes straight from it; counts for a $filter are computed
+# once per data version and kept here. An entity set without a published
+# count (table missing, or a load in progress) is always counted.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db_connection import get_db_engine
+from metrics import instrumented_connection, record_cache
+
+COUNTS_TABLE = 'odata_entity_counts'
+VERSION_TTL = int(os.getenv('ODATA_COUNT_VERSION_TTL', 60))
+
+# Filtered counts kept per worker (least recently used are dropped first)
+MAX_CACHED_FILTER_COUNTS = 1024
+
+# (loaded_at, {entity_set: (data_version, row_count)}) - replaced in one assignment
+_versions = (float('-inf'), {})
+# (entity_set, data_version, normalized filter) -> count
+_filter_counts = OrderedDict()
+_lock = threading.Lock()
+
+def get_data_versions():
+    """{entity_set: (data_version, row_count)} as published by the ETL"""
+    global _versions
+
+    loaded_at, versions = _versions
+    if time.monotonic() - loaded_at < VERSION_TTL:
+        return versions
+
+    from sqlalchemy import text
+
+    try:
+        with instrumented_connection(get_db_engine()) as connection:
+            rows = connection.execute(
+                text(f"SELECT entity_set, data_version, row_count FROM {COUNTS_TABLE}")
+            ).fetchall()
+        versions = {row[0]: (str(row[1]), int(row[2])) for row in rows}
+    except Exception as e:
+        # No counts table (or no database) - fall back to counting
+        print(f"Entity counts unavailable: {str(e)}")  # Debug log
+        versions = {}
+    _versions = (time.monotonic(), versions)
+    return versions
+
+def current_data_version(entity_set):
+    """Published data version of an entity set, or None if it has none"""
+    version = get_data_versions().get(entity_set)
+    return version[0] if version is not None else None
+
+def lookup_count(entity_set, normalized_filter=''):
+    """(count, data_version) - count is None if it has to be computed
+
+    Pass the returned data_version to store_count, so a count computed from
+    the rows loaded now is never stored under a version published later.
+    """
+    version = get_data_versions().get(entity_set)
+    if version is None:
+        record_cache('odata_count', False)
+        return None, None
+
+    data_version, row_count = version
+    if not normalized_filter:
+        count = row_count
+    else:
+        key = (entity_set, data_version, normalized_filter)
+        with _lock:
+            count = _filter_counts.get(key)
+            if count is not None:
+                _filter_counts.move_to_end(key)
+    record_cache('odata_count', count is not None)
+    return count, data_version
+
+def store_count(entity_set, data_version, normalized_filter, count):
+    """Remember a filtered count computed from the data of `data_version`
+
+    `data_version` must be captured (current_data_version / lookup_count)
+    before the rows were loaded.
+    """
+    if data_version is None or not normalized_filter:
+        return
+    key = (entity_set, data_version, normalized_filter)
+    with _lock:
+        _filter_counts[key] = count
+        _filter_counts.move_to_end(key)
+        while len(_filter_counts) > MAX_CACHED_FILTER_COUNTS:
+            _filter_counts.popitem(last=False)
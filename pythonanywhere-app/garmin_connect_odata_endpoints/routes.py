@@ -1,24 +1,37 @@
 # Garmin Activities OData Endpoints Blueprint
 # This project provides OData v4 endpoints for Garmin Connect activity data from MySQL database
+#
+# pandas/numpy (and SQLAlchemy, via db_connection) are imported on first use
+# (see warm_up) so loading the app doesn't pay for them up front
 
+import hashlib
 import json
 import os
+import re
 import sys
-import pandas as pd
-import numpy as np
-from flask import Blueprint, request, Response
+import threading
+from collections import OrderedDict
+from flask import Blueprint, abort, request, Response
 
 # Add parent directory to path to import db_connection module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from db_connection import get_db_engine
+from metrics import instrumented_connection, timed_phase
+from profiling import PROFILE_PARAMS
+from garmin_connect_odata_endpoints.entity_counts import current_data_version, lookup_count, store_count
 
 # Create blueprint
 garmin_bp = Blueprint('garmin_activities', __name__, url_prefix='/garmin_activities')
 
-@garmin_bp.route("/$metadata")
-def metadata():
-    """OData v4 metadata document describing the Garmin Activities entity"""
-    metadata_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+def warm_up():
+    """Import the heavy dependencies ahead of the first request"""
+    import numpy
+    import pandas
+    import sqlalchemy
+
+# OData v4 metadata document describing the Garmin Activities entities.
+# Built once at import along with its ETag - it only changes on deploy.
+METADATA_XML = '''<?xml version="1.0" encoding="UTF-8"?>
 <edmx:Edmx xmlns:edmx="http://docs.oasis-open.org/odata/ns/edmx" Version="4.0">
   <edmx:DataServices>
     <Schema xmlns="http://docs.oasis-open.org/odata/ns/edm" Namespace="GarminActivitiesService">
@@ -85,29 +98,370 @@ def metadata():
         <Property Name="DifferenceStress" Type="Edm.Double"/>
         <Property Name="MaxStress" Type="Edm.Double"/>
       </EntityType>
+      <EntityType Name="Lap">
+        <Key>
+          <PropertyRef Name="ActivityId"/>
+          <PropertyRef Name="LapIndex"/>
+        </Key>
+        <Property Name="ActivityId" Type="Edm.Int64" Nullable="false"/>
+        <Property Name="LapIndex" Type="Edm.Int32" Nullable="false"/>
+        <Property Name="StartTimeGMT" Type="Edm.String"/>
+        <Property Name="DistanceMiles" Type="Edm.Double"/>
+        <Property Name="DurationSeconds" Type="Edm.Double"/>
+        <Property Name="MovingDurationSeconds" Type="Edm.Double"/>
+        <Property Name="ElevationGainMeters" Type="Edm.Double"/>
+        <Property Name="ElevationLossMeters" Type="Edm.Double"/>
+        <Property Name="AverageSpeed" Type="Edm.Double"/>
+        <Property Name="MaxSpeed" Type="Edm.Double"/>
+        <Property Name="AverageHR" Type="Edm.Double"/>
+        <Property Name="MaxHR" Type="Edm.Double"/>
+        <Property Name="AverageRunCadence" Type="Edm.Double"/>
+        <Property Name="MaxRunCadence" Type="Edm.Double"/>
+        <Property Name="StrideLength" Type="Edm.Double"/>
+        <Property Name="Calories" Type="Edm.Double"/>
+      </EntityType>
+      <EntityType Name="Split">
+        <Key>
+          <PropertyRef Name="ActivityId"/>
+          <PropertyRef Name="SplitType"/>
+        </Key>
+        <Property Name="ActivityId" Type="Edm.Int64" Nullable="false"/>
+        <Property Name="SplitType" Type="Edm.String" Nullable="false"/>
+        <Property Name="NumberOfSplits" Type="Edm.Int32"/>
+        <Property Name="DistanceMiles" Type="Edm.Double"/>
+        <Property Name="DurationSeconds" Type="Edm.Double"/>
+        <Property Name="MovingDurationSeconds" Type="Edm.Double"/>
+        <Property Name="ElevationGainMeters" Type="Edm.Double"/>
+        <Property Name="ElevationLossMeters" Type="Edm.Double"/>
+        <Property Name="AverageSpeed" Type="Edm.Double"/>
+        <Property Name="MaxSpeed" Type="Edm.Double"/>
+        <Property Name="AverageHR" Type="Edm.Double"/>
+        <Property Name="MaxHR" Type="Edm.Double"/>
+        <Property Name="Calories" Type="Edm.Double"/>
+      </EntityType>
       <EntityContainer Name="Container">
         <EntitySet Name="activities" EntityType="GarminActivitiesService.Activity"/>
+        <EntitySet Name="laps" EntityType="GarminActivitiesService.Lap"/>
+        <EntitySet Name="splits" EntityType="GarminActivitiesService.Split"/>
       </EntityContainer>
     </Schema>
   </edmx:DataServices>
 </edmx:Edmx>'''
-    return Response(metadata_xml, mimetype='application/xml', headers={'OData-Version': '4.0'})
+METADATA_BYTES = METADATA_XML.encode('utf-8')
+METADATA_ETAG = hashlib.sha1(METADATA_BYTES).hexdigest()[:16]
+
+# Metadata and service document can be cached by clients, revalidating with the ETag
+METADATA_MAX_AGE = 3600
+
+# url_root -> (service document bytes, ETag), built on first request per host.
+# url_root comes from the client's Host header, so only the most recently used
+# few are kept.
+MAX_CACHED_SERVICE_DOCS = 8
+_service_docs = OrderedDict()
+_service_docs_lock = threading.Lock()
+
+def _cacheable_response(body, etag, mimetype, headers):
+    """Response for prebuilt bytes with an ETag (If-None-Match is handled by http_caching)"""
+    response = Response(body, mimetype=mimetype, headers=headers)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = METADATA_MAX_AGE
+    return response
+
+@garmin_bp.route("/$metadata")
+def metadata():
+    """OData v4 metadata document describing the Garmin Activities entities"""
+    return _cacheable_response(METADATA_BYTES, METADATA_ETAG, 'application/xml', {'OData-Version': '4.0'})
 
 @garmin_bp.route("/")
 def service_doc():
     """OData v4 service document"""
-    service_doc = {
-        "@odata.context": f"{request.url_root}garmin_activities/$metadata",
-        "value": [
-            {
-                "name": "activities",
-                "kind": "EntitySet",
-                "url": "activities"
-            }
-        ]
+    with _service_docs_lock:
+        cached = _service_docs.get(request.url_root)
+        if cached is not None:
+            _service_docs.move_to_end(request.url_root)
+    if cached is None:
+        service_doc = {
+            "@odata.context": f"{request.url_root}garmin_activities/$metadata",
+            "value": [
+                {
+                    "name": entity_set,
+                    "kind": "EntitySet",
+                    "url": entity_set
+                }
+                for entity_set in ENTITY_SET_QUERIES
+            ]
+        }
+        body = json.dumps(service_doc).encode('utf-8')
+        cached = (body, hashlib.sha1(body).hexdigest()[:16])
+        with _service_docs_lock:
+            _service_docs[request.url_root] = cached
+            while len(_service_docs) > MAX_CACHED_SERVICE_DOCS:
+                _service_docs.popitem(last=False)
+    body, etag = cached
+    return _cacheable_response(
+        body,
+        etag,
+        'application/json',
+        {
+            'OData-Version': '4.0',
+            'Content-Type': 'application/json; odata.metadata=minimal'
+        }
+    )
+
+# Query for the activities entity set
+ACTIVITIES_QUERY = "SELECT * FROM garmin_connect_activities"
+
+# Query behind each entity set (laps and splits are loaded by
+# scheduled_tasks/03 - Enrich Garmin Activity Details.py, with OData-ready column names)
+ENTITY_SET_QUERIES = {
+    'activities': ACTIVITIES_QUERY,
+    'laps': "SELECT * FROM garmin_connect_activity_laps",
+    'splits': "SELECT * FROM garmin_connect_activity_splits",
+}
+
+# Map database column names to OData-compliant property names
+COLUMN_MAPPING = {
+    'Activity Type': 'ActivityType',
+    'Activity Name': 'ActivityName',
+    'Location Name': 'LocationName',
+    'Distance (miles)': 'DistanceMiles',
+    'Duration (HH:MM:SS.sss)': 'Duration',
+    'Elapsed Duration (H:MM:SS.sss)': 'ElapsedDuration',
+    'Moving Duration (HH:MM:SS.sss)': 'MovingDuration',
+    'Elevation Gain - meters': 'ElevationGainMeters',
+    'Elevation Loss - meters': 'ElevationLossMeters',
+    'Average Speed': 'AverageSpeed',
+    'Max Speed': 'MaxSpeed',
+    'BMR Calories': 'BMRCalories',
+    'Average HR': 'AverageHR',
+    'Max HR': 'MaxHR',
+    'Average Running Cadence In Steps Per Minute': 'AverageRunningCadenceInStepsPerMinute',
+    'Max Running Cadence In Steps Per Minute': 'MaxRunningCadenceInStepsPerMinute',
+    'Privacy Setting': 'PrivacySetting',
+    'Aerobic Training Effect': 'AerobicTrainingEffect',
+    'Anaerobic Training Effect': 'AnaerobicTrainingEffect',
+    'Avg Stride Length': 'AvgStrideLength',
+    'Min Temperature': 'MinTemperature',
+    'Max Temperature': 'MaxTemperature',
+    'Min Elevation': 'MinElevation',
+    'Max Elevation': 'MaxElevation',
+    'Max Double Cadence': 'MaxDoubleCadence',
+    'Max Vertical Speed': 'MaxVerticalSpeed',
+    'Lap Count': 'LapCount',
+    'Water Estimated': 'WaterEstimated',
+    'Training Effect Label': 'TrainingEffectLabel',
+    'Activity Training Load': 'ActivityTrainingLoad',
+    'Min Activity Lap Duration': 'MinActivityLapDuration',
+    'Aerobic Training Effect Message': 'AerobicTrainingEffectMessage',
+    'Anaerobic Training Effect Message': 'AnaerobicTrainingEffectMessage',
+    'Moderate Intensity Minutes': 'ModerateIntensityMinutes',
+    'Vigorous Intensity Minutes': 'VigorousIntensityMinutes',
+    'Fastest Split 1000': 'FastestSplit1000',
+    'Manual Activity': 'ManualActivity',
+    'VO2 Max Value': 'VO2MaxValue',
+    'Avg Weight Per Rep': 'AvgWeightPerRep',
+    'Avg Vertical Speed': 'AvgVerticalSpeed',
+    'Calories Consumed': 'CaloriesConsumed',
+    'Water Consumed': 'WaterConsumed',
+    'Min Respiration Rate': 'MinRespirationRate',
+    'Max Respiration Rate': 'MaxRespirationRate',
+    'Avg Respiration Rate': 'AvgRespirationRate',
+    'Avg Stress': 'AvgStress',
+    'Start Stress': 'StartStress',
+    'End Stress': 'EndStress',
+    'Difference Stress': 'DifferenceStress',
+    'Max Stress': 'MaxStress'
+}
+
+def records_from_dataframe(df):
+    """Convert activity rows to JSON-ready OData records"""
+    import numpy as np
+    import pandas as pd
+
+    # Replace NaN/None values with None for proper JSON serialization
+    df = df.replace({pd.NA: None, pd.NaT: None, np.nan: None})
+    
+    # Rename columns to OData-compliant names
+    df = df.rename(columns=COLUMN_MAPPING)
+    
+    # Convert DataFrame to list of dictionaries
+    data = df.to_dict('records')
+    
+    # Convert any remaining problematic types to strings
+    for record in data:
+        for key, value in record.items():
+            if pd.isna(value) if hasattr(value, '__iter__') and not isinstance(value, str) else value is None:
+                record[key] = None
+            elif isinstance(value, (pd.Timestamp, pd.Timedelta)):
+                record[key] = str(value)
+            elif isinstance(value, (np.integer, np.floating)):
+                record[key] = value.item()
+        
+        # Convert Boolean-like fields to strings (PR, ManualActivity)
+        if 'PR' in record and record['PR'] is not None:
+            record['PR'] = str(record['PR'])
+        if 'ManualActivity' in record and record['ManualActivity'] is not None:
+            record['ManualActivity'] = str(record['ManualActivity'])
+    
+    return data
+
+class ODataQueryError(ValueError):
+    """A query option the service can't handle - reported to the client as 400"""
+
+def _query_int(args, name, default):
+    """Non-negative integer query option ($skip/$top)"""
+    value = args.get(name, default)
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ODataQueryError(f"{name} must be an integer, got: {value}")
+    if number < 0:
+        raise ODataQueryError(f"{name} must not be negative, got: {value}")
+    return number
+
+# One "Field eq value" clause of $filter, optionally followed by "and"
+FILTER_CLAUSE = re.compile(r"\s*(\w+)\s+eq\s+('(?:[^']|'')*'|[-+\w.]+)\s*(?:(and)\s|$)", re.IGNORECASE)
+
+def parse_filter(filter_expr):
+    """Parse "Field eq 'text'" / "Field eq number" clauses joined by "and"
+
+    Returns the clauses as sorted (field, value) pairs, so equivalent filters
+    compare equal. Raises ODataQueryError for anything else.
+    """
+    clauses = []
+    position = 0
+    filter_expr = (filter_expr or '').strip()
+    while position < len(filter_expr):
+        match = FILTER_CLAUSE.match(filter_expr, position)
+        if match is None:
+            raise ODataQueryError(f"Unsupported $filter: {filter_expr} (only 'Field eq value' clauses joined by 'and')")
+        field, value = match.group(1), match.group(2)
+        if value.startswith("'"):
+            value = value[1:-1].replace("''", "'")
+        else:
+            try:
+                value = float(value)
+            except ValueError:
+                raise ODataQueryError(f"Unsupported $filter value: {value} (quote text values)")
+        clauses.append((field, value))
+        position = match.end()
+    return sorted(clauses, key=repr)
+
+def normalize_filter(filter_expr):
+    """Canonical form of a $filter ('' for no filter) - the key for cached counts"""
+    return ' and '.join(f"{field} eq {value!r}" for field, value in parse_filter(filter_expr))
+
+def apply_filter(data, clauses):
+    """Records matching every (field, value) clause"""
+    def matches(item):
+        for field, value in clauses:
+            actual = item.get(field)
+            if actual is None:
+                return False
+            if isinstance(value, float):
+                try:
+                    if float(actual) != value:
+                        return False
+                except (TypeError, ValueError):
+                    return False
+            elif str(actual) != value:
+                return False
+        return True
+
+    return [item for item in data if matches(item)]
+
+def apply_select(data, select):
+    """Records with only the comma-separated $select fields"""
+    fields = [f.strip() for f in select.split(',')]
+    return [{k: v for k, v in item.items() if k in fields} for item in data]
+
+def page_bounds(args):
+    """($skip, $top) of a request - $top defaults to a page size of 1000"""
+    return _query_int(args, '$skip', 0), _query_int(args, '$top', 1000)
+
+def next_link(args, base_url, skip, top):
+    """URL of the page after $skip/$top, preserving the other query parameters"""
+    next_params = {k: v for k, v in args.items() if k not in PROFILE_PARAMS}
+    next_params['$skip'] = str(skip + top)
+    next_params['$top'] = str(top)
+    param_string = '&'.join([f"{k}={v}" for k, v in next_params.items()])
+    return f"{base_url}?{param_string}"
+
+def build_odata_page(data, args, base_url, url_root, entity_set='activities'):
+    """Apply OData query options to the records and build the response payload
+    
+    Shared by the Flask view and the ASGI path (asgi.py) so both keep the same
+    OData semantics. `args` is any mapping of query parameters.
+    """
+    # $filter - equality clauses joined by "and"
+    if '$filter' in args:
+        data = apply_filter(data, parse_filter(args['$filter']))
+
+    # $select - select specific fields
+    if '$select' in args:
+        data = apply_select(data, args['$select'])
+    
+    # $orderby - sort data
+    if '$orderby' in args:
+        orderby = args['$orderby']
+        reverse = False
+        if ' desc' in orderby:
+            orderby = orderby.replace(' desc', '').strip()
+            reverse = True
+        elif ' asc' in orderby:
+            orderby = orderby.replace(' asc', '').strip()
+        data = sorted(data, key=lambda x: x.get(orderby, ''), reverse=reverse)
+    
+    # Handle pagination with $skip and $top
+    skip, top = page_bounds(args)
+    
+    # Get total count before pagination
+    total_count = len(data)
+    
+    # Apply skip and top
+    data = data[skip:skip + top]
+    
+    # Build OData response
+    odata_response = {
+        "@odata.context": f"{url_root}garmin_activities/$metadata#{entity_set}"
     }
+    
+    # Add count if requested
+    if '$count' in args and args['$count'].lower() == 'true':
+        odata_response["@odata.count"] = total_count
+    
+    # Add nextLink if there are more records ($top=0 only asks for the count)
+    if top > 0 and skip + top < total_count:
+        odata_response["@odata.nextLink"] = next_link(args, base_url, skip, top)
+    
+    odata_response["value"] = data
+    
+    print(f"Returning {len(data)} records (skip={skip}, top={top}, total={total_count})")  # Debug log
+    
+    return odata_response
+
+def load_records(entity_set):
+    """Query an entity set's table and convert the rows to OData records"""
+    import pandas as pd
+
+    # Get database engine
+    engine = get_db_engine()
+    
+    # Query all data from the entity set's table
+    with instrumented_connection(engine) as connection, timed_phase('db_query'):
+        df = pd.read_sql(ENTITY_SET_QUERIES[entity_set], connection)
+    
+    with timed_phase('transform'):
+        return records_from_dataframe(df)
+
+def odata_json_response(payload):
+    """OData JSON response for a payload"""
+    with timed_phase('serialization'):
+        body = json.dumps(payload, default=str)  # default=str handles datetime conversion
+    
     return Response(
-        json.dumps(service_doc),
+        body,
         mimetype='application/json',
         headers={
             'OData-Version': '4.0',
@@ -115,163 +469,90 @@ def service_doc():
         }
     )
 
-@garmin_bp.route("/activities")
-def activities_data():
-    """Fetch Garmin activities from MySQL database and return as OData JSON"""
+def odata_error_response(e, entity_set, status=500):
+    """JSON error response (server errors are logged with their traceback)"""
+    if status == 500:
+        print(f"Error in garmin_{entity_set} endpoint: {str(e)}")  # Debug log
+        import traceback
+        traceback.print_exc()
+    return Response(
+        json.dumps({"error": str(e)}),
+        status=status,
+        mimetype='application/json'
+    )
+
+def entity_set_response(entity_set):
+    """Query an entity set's table and return it as an OData JSON response"""
     try:
-        # Get database engine
-        engine = get_db_engine()
-        
-        # Query all data from garmin_connect_activities table
-        query = "SELECT * FROM garmin_connect_activities"
-        df = pd.read_sql(query, engine)
-        
-        # Replace NaN/None values with None for proper JSON serialization
-        df = df.replace({pd.NA: None, pd.NaT: None, np.nan: None})
-        
-        # Map database column names to OData-compliant property names
-        column_mapping = {
-            'Activity Type': 'ActivityType',
-            'Activity Name': 'ActivityName',
-            'Location Name': 'LocationName',
-            'Distance (miles)': 'DistanceMiles',
-            'Duration (HH:MM:SS.sss)': 'Duration',
-            'Elapsed Duration (H:MM:SS.sss)': 'ElapsedDuration',
-            'Moving Duration (HH:MM:SS.sss)': 'MovingDuration',
-            'Elevation Gain - meters': 'ElevationGainMeters',
-            'Elevation Loss - meters': 'ElevationLossMeters',
-            'Average Speed': 'AverageSpeed',
-            'Max Speed': 'MaxSpeed',
-            'BMR Calories': 'BMRCalories',
-            'Average HR': 'AverageHR',
-            'Max HR': 'MaxHR',
-            'Average Running Cadence In Steps Per Minute': 'AverageRunningCadenceInStepsPerMinute',
-            'Max Running Cadence In Steps Per Minute': 'MaxRunningCadenceInStepsPerMinute',
-            'Privacy Setting': 'PrivacySetting',
-            'Aerobic Training Effect': 'AerobicTrainingEffect',
-            'Anaerobic Training Effect': 'AnaerobicTrainingEffect',
-            'Avg Stride Length': 'AvgStrideLength',
-            'Min Temperature': 'MinTemperature',
-            'Max Temperature': 'MaxTemperature',
-            'Min Elevation': 'MinElevation',
-            'Max Elevation': 'MaxElevation',
-            'Max Double Cadence': 'MaxDoubleCadence',
-            'Max Vertical Speed': 'MaxVerticalSpeed',
-            'Lap Count': 'LapCount',
-            'Water Estimated': 'WaterEstimated',
-            'Training Effect Label': 'TrainingEffectLabel',
-            'Activity Training Load': 'ActivityTrainingLoad',
-            'Min Activity Lap Duration': 'MinActivityLapDuration',
-            'Aerobic Training Effect Message': 'AerobicTrainingEffectMessage',
-            'Anaerobic Training Effect Message': 'AnaerobicTrainingEffectMessage',
-            'Moderate Intensity Minutes': 'ModerateIntensityMinutes',
-            'Vigorous Intensity Minutes': 'VigorousIntensityMinutes',
-            'Fastest Split 1000': 'FastestSplit1000',
-            'Manual Activity': 'ManualActivity',
-            'VO2 Max Value': 'VO2MaxValue',
-            'Avg Weight Per Rep': 'AvgWeightPerRep',
-            'Avg Vertical Speed': 'AvgVerticalSpeed',
-            'Calories Consumed': 'CaloriesConsumed',
-            'Water Consumed': 'WaterConsumed',
-            'Min Respiration Rate': 'MinRespirationRate',
-            'Max Respiration Rate': 'MaxRespirationRate',
-            'Avg Respiration Rate': 'AvgRespirationRate',
-            'Avg Stress': 'AvgStress',
-            'Start Stress': 'StartStress',
-            'End Stress': 'EndStress',
-            'Difference Stress': 'DifferenceStress',
-            'Max Stress': 'MaxStress'
-        }
-        
-        # Rename columns to OData-compliant names
-        df = df.rename(columns=column_mapping)
-        
-        # Convert DataFrame to list of dictionaries
-        data = df.to_dict('records')
-        
-        # Convert any remaining problematic types to strings
-        for record in data:
-            for key, value in record.items():
-                if pd.isna(value) if hasattr(value, '__iter__') and not isinstance(value, str) else value is None:
-                    record[key] = None
-                elif isinstance(value, (pd.Timestamp, pd.Timedelta)):
-                    record[key] = str(value)
-                elif isinstance(value, (np.integer, np.floating)):
-                    record[key] = value.item()
-            
-            # Convert Boolean-like fields to strings (PR, ManualActivity)
-            if 'PR' in record and record['PR'] is not None:
-                record['PR'] = str(record['PR'])
-            if 'ManualActivity' in record and record['ManualActivity'] is not None:
-                record['ManualActivity'] = str(record['ManualActivity'])
-        
-        # Apply OData query parameters
         args = request.args
+        count_requested = args.get('$count', '').lower() == 'true'
+        normalized_filter = normalize_filter(args.get('$filter'))
+
+        # Data version of the rows about to be loaded, captured before loading them
+        # so their count is cached under the right version
+        data_version = None
+
+        # Count probe ($top=0&$count=true) - answer from the count cache without loading the table
+        if count_requested and args.get('$top') == '0':
+            count, data_version = lookup_count(entity_set, normalized_filter)
+            if count is not None:
+                return odata_json_response({
+                    "@odata.context": f"{request.url_root}garmin_activities/$metadata#{entity_set}",
+                    "@odata.count": count,
+                    "value": []
+                })
+        elif count_requested:
+            data_version = current_data_version(entity_set)
+
+        data = load_records(entity_set)
         
-        # $select - select specific fields
-        if '$select' in args:
-            fields = [f.strip() for f in args['$select'].split(',')]
-            data = [{k: v for k, v in item.items() if k in fields} for item in data]
-        
-        # $orderby - sort data
-        if '$orderby' in args:
-            orderby = args['$orderby']
-            reverse = False
-            if ' desc' in orderby:
-                orderby = orderby.replace(' desc', '').strip()
-                reverse = True
-            elif ' asc' in orderby:
-                orderby = orderby.replace(' asc', '').strip()
-            data = sorted(data, key=lambda x: x.get(orderby, ''), reverse=reverse)
-        
-        # Handle pagination with $skip and $top
-        skip = int(args.get('$skip', 0))
-        top = int(args.get('$top', 1000))  # Default page size of 1000
-        
-        # Get total count before pagination
-        total_count = len(data)
-        
-        # Apply skip and top
-        data = data[skip:skip + top]
-        
-        # Build OData response
-        odata_response = {
-            "@odata.context": f"{request.url_root}garmin_activities/$metadata#activities"
-        }
-        
-        # Add count if requested
-        if '$count' in args and args['$count'].lower() == 'true':
-            odata_response["@odata.count"] = total_count
-        
-        # Add nextLink if there are more records
-        if skip + top < total_count:
-            next_skip = skip + top
-            # Build next link preserving other query parameters
-            next_params = dict(args)
-            next_params['$skip'] = str(next_skip)
-            next_params['$top'] = str(top)
-            param_string = '&'.join([f"{k}={v}" for k, v in next_params.items()])
-            odata_response["@odata.nextLink"] = f"{request.base_url}?{param_string}"
-        
-        odata_response["value"] = data
-        
-        print(f"Returning {len(data)} records (skip={skip}, top={top}, total={total_count})")  # Debug log
+        # Apply OData query parameters
+        with timed_phase('transform'):
+            odata_response = build_odata_page(data, args, request.base_url, request.url_root, entity_set)
+        if count_requested:
+            store_count(entity_set, data_version, normalized_filter, odata_response["@odata.count"])
         
-        return Response(
-            json.dumps(odata_response, default=str),  # default=str handles datetime conversion
-            mimetype='application/json',
-            headers={
-                'OData-Version': '4.0',
-                'Content-Type': 'application/json; odata.metadata=minimal'
-            }
-        )
+        return odata_json_response(odata_response)
         
+    except ODataQueryError as e:
+        return odata_error_response(e, entity_set, status=400)
     except Exception as e:
-        print(f"Error in garmin_activities endpoint: {str(e)}")  # Debug log
-        import traceback
-        traceback.print_exc()
-        return Response(
-            json.dumps({"error": str(e)}),
-            status=500,
-            mimetype='application/json'
-        )
+        return odata_error_response(e, entity_set)
+
+@garmin_bp.route("/activities")
+def activities_data():
+    """Fetch Garmin activities from MySQL database and return as OData JSON"""
+    return entity_set_response('activities')
+
+@garmin_bp.route("/laps")
+def laps_data():
+    """Fetch per-activity laps from MySQL database and return as OData JSON"""
+    return entity_set_response('laps')
+
+@garmin_bp.route("/splits")
+def splits_data():
+    """Fetch per-activity split summaries from MySQL database and return as OData JSON"""
+    return entity_set_response('splits')
+
+@garmin_bp.route("/<entity_set>/$count")
+def entity_set_count(entity_set):
+    """OData $count path segment - the number of (filtered) records as plain text"""
+    if entity_set not in ENTITY_SET_QUERIES:
+        abort(404)
+
+    try:
+        normalized_filter = normalize_filter(request.args.get('$filter'))
+        count, data_version = lookup_count(entity_set, normalized_filter)
+        if count is None:
+            data = load_records(entity_set)
+            with timed_phase('transform'):
+                if normalized_filter:
+                    data = apply_filter(data, parse_filter(request.args['$filter']))
+                count = len(data)
+            store_count(entity_set, data_version, normalized_filter, count)
+        return Response(str(count), mimetype='text/plain', headers={'OData-Version': '4.0'})
+
+    except ODataQueryError as e:
+        return odata_error_response(e, entity_set, status=400)
+    except Exception as e:
+        return odata_error_response(e, entity_set)
@@ -0,0 +1,162 @@
+# HTTP Caching & Compression Middleware
+# App-level response handling shared by every blueprint: gzip/brotli content
+# negotiation, strong ETags with If-None-Match support, and Cache-Control for
+# static files. best_encoding/compress_stream/StreamCompressor are also used by
+# the native ASGI routes (asgi.py), which bypass Flask's after_request hooks.
+
+import gzip
+import hashlib
+import zlib
+
+from flask import request
+from werkzeug.http import parse_accept_header
+from metrics import record_cache
+
+# Brotli is optional - fall back to gzip only when it isn't installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Defaults (override via app.config)
+DEFAULT_MIN_SIZE = 500            # Don't bother compressing tiny responses
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5
+DEFAULT_STATIC_MAX_AGE = 604800   # One week for static files
+
+# Mimetypes worth compressing (images/fonts/etc. are already compressed)
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/xml',
+    'application/javascript',
+    'image/svg+xml',
+}
+
+def _supported_encodings():
+    """Content-codings we can produce, in order of server preference"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def _is_compressible(response):
+    """Whether the response mimetype is worth compressing"""
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+
+def best_encoding(accept_encoding):
+    """Preferred content-coding for an Accept-Encoding header value, or None"""
+    return parse_accept_header(accept_encoding).best_match(_supported_encodings())
+
+def _choose_encoding(response, min_size):
+    """Pick a content-coding for the response, or None to send it as-is"""
+    if 'Content-Encoding' in response.headers:
+        return None
+    if not _is_compressible(response):
+        return None
+    if response.content_length is not None and response.content_length < min_size:
+        return None
+    return request.accept_encodings.best_match(_supported_encodings())
+
+def _compress(data, encoding, config):
+    """Compress a complete body"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=config.get('COMPRESS_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY))
+    return gzip.compress(data, compresslevel=config.get('COMPRESS_GZIP_LEVEL', DEFAULT_GZIP_LEVEL))
+
+class StreamCompressor:
+    """Incremental compressor for one body: compress() each chunk, then finish()"""
+
+    def __init__(self, encoding, config):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=config.get('COMPRESS_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY))
+            self._compress = self._compressor.process
+            self._finish = self._compressor.finish
+        else:
+            # wbits=31 writes a gzip header/trailer around the deflate stream
+            self._compressor = zlib.compressobj(config.get('COMPRESS_GZIP_LEVEL', DEFAULT_GZIP_LEVEL), zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._finish = self._compressor.flush
+
+    def compress(self, chunk):
+        return self._compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
+    def finish(self):
+        return self._finish()
+
+def compress_stream(chunks, encoding, config):
+    """Compress a streamed body chunk by chunk without buffering it"""
+    compressor = StreamCompressor(encoding, config)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+def _add_vary(response):
+    """Tell caches the body depends on Accept-Encoding"""
+    if 'Accept-Encoding' not in response.vary:
+        response.vary.add('Accept-Encoding')
+
+def init_http_caching(app):
+    """Register the caching/compression after_request handler on the app"""
+
+    @app.after_request
+    def compress_and_cache(response):
+        config = app.config
+
+        # Long-lived caching for static files (app and blueprint static folders)
+        if request.endpoint and request.endpoint.split('.')[-1] == 'static':
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = config.get('STATIC_MAX_AGE', DEFAULT_STATIC_MAX_AGE)
+
+        # Only successful GET/HEAD responses are cacheable or worth compressing
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+
+        min_size = config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        encoding = _choose_encoding(response, min_size)
+        if _is_compressible(response):
+            _add_vary(response)
+
+        # Static files come from send_file (direct passthrough), which already
+        # handles ETags/conditional requests - only step in to compress them
+        if response.direct_passthrough:
+            if not encoding:
+                return response
+            response.direct_passthrough = False
+
+        # Streamed responses: compress on the fly, no ETag (body isn't known up front)
+        elif response.is_streamed:
+            if encoding:
+                response.response = compress_stream(response.response, encoding, config)
+                response.headers['Content-Encoding'] = encoding
+                response.headers.pop('Content-Length', None)
+            return response
+
+        data = response.get_data()
+
+        # Strong ETag from the uncompressed body (unless the view set one),
+        # suffixed per coding since each encoded representation differs
+        etag, is_weak = response.get_etag()
+        if etag is None:
+            etag = hashlib.sha1(data).hexdigest()
+            is_weak = False
+        if encoding:
+            etag = f"{etag}-{encoding}"
+        response.set_etag(etag, weak=is_weak)
+
+        # If-None-Match: the client already has this representation
+        if request.if_none_match:
+            hit = request.if_none_match.contains_weak(etag)
+            record_cache('http_etag', hit)
+            if hit:
+                response.status_code = 304
+                return response
+
+        if encoding:
+            response.set_data(_compress(data, encoding, config))
+            response.headers['Content-Encoding'] = encoding
+            response.headers.pop('Accept-Ranges', None)
+
+        return response
+
+    return app
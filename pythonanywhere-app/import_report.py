@@ -0,0 +1,57 @@
+"""
+Startup Import-Time Report
+
+Measures what importing server.py costs (the work a web worker does on every
+reload) using `python -X importtime`, lists the slowest imports, and fails when
+the total is over budget.
+
+USAGE:
+------
+    python import_report.py                  # report, default 300 ms budget
+    python import_report.py --budget-ms 150 --top 25
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def measure_imports(module):
+    """Return [(module, self_us, cumulative_us)] for importing `module`"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=APP_DIR, capture_output=True, text=True, check=True
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the import cost of server.py')
+    parser.add_argument('--module', default='server', help='Module to import (default: server)')
+    parser.add_argument('--budget-ms', type=float, default=300, help='Fail above this total (default: 300)')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to list (default: 15)')
+    args = parser.parse_args()
+
+    imports = measure_imports(args.module)
+    total_ms = next(cum for name, _, cum in imports if name == args.module) / 1000
+
+    print(f"Slowest imports (cumulative) for 'import {args.module}':")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda i: i[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  (self {self_us / 1000:7.1f} ms)  {name}")
+
+    print(f"\nTotal: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("Over budget!")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
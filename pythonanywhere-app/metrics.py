@@ -0,0 +1,172 @@
+# Request Metrics
+# In-process request timing and hot-path instrumentation for every blueprint,
+# exposed at /metrics in the Prometheus text exposition format.
+#
+# Metrics are kept per worker process (each gunicorn worker reports its own).
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from profiling import record_profile_phase
+
+# Histogram buckets (seconds / bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1024, 10240, 102400, 524288, 1048576, 5242880, 10485760)
+
+_registry = []
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            # [per-bucket counts, sum, count]
+            state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                labels = list(zip(self.labelnames, key))
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+# ============================================================================
+# METRICS: Everything exported at /metrics
+# ============================================================================
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route',
+    ('endpoint', 'method', 'status'))
+PHASE_LATENCY = Histogram(
+    'http_request_phase_seconds', 'Time spent in each phase of a request (db_query, transform, serialization, render, ...)',
+    ('endpoint', 'phase'))
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response payload size as sent (after compression)',
+    ('endpoint',), buckets=SIZE_BUCKETS)
+POOL_CHECKOUT = Histogram(
+    'db_pool_checkout_seconds', 'Time waiting to check a connection out of the database pool',
+    ('endpoint',))
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache name and result (hit/miss)',
+    ('cache', 'result'))
+
+def _current_endpoint():
+    """Endpoint label for the active request ('none' outside a request)"""
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'none'
+
+def observe_phase(phase, seconds, endpoint=None):
+    """Record the duration of one phase of the current request
+
+    `endpoint` labels requests served outside Flask (the native ASGI routes).
+    """
+    PHASE_LATENCY.observe(seconds, endpoint=endpoint or _current_endpoint(), phase=phase)
+    if has_request_context():
+        record_profile_phase(phase, seconds)
+
+@contextmanager
+def timed_phase(phase, endpoint=None):
+    """Time a block of work as one phase of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start, endpoint)
+
+@contextmanager
+def instrumented_connection(engine):
+    """Check a connection out of the engine's pool, recording the wait"""
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        POOL_CHECKOUT.observe(time.perf_counter() - start, endpoint=_current_endpoint())
+        yield connection
+
+def record_cache(cache, hit):
+    """Count a cache hit or miss"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+def render_metrics():
+    """All metrics in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def init_metrics(app):
+    """Register request timing hooks and the /metrics endpoint on the app"""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unknown'
+            REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint,
+                                    method=request.method, status=response.status_code)
+            if response.content_length is not None:
+                RESPONSE_SIZE.observe(response.content_length, endpoint=endpoint)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    return app
@@ -0,0 +1,144 @@
+# Request Profiler
+# Opt-in cProfile run of a single request to any blueprint route, for production
+# debugging without redeploying ad-hoc timing code.
+#
+# Disabled unless PROFILE_SECRET is set. To profile a request, send the secret
+# and ask for a report:
+#
+#   curl -H "X-Profile-Secret: $PROFILE_SECRET" \
+#        "https://.../garmin_activities/activities?_profile=inline"
+#
+#   _profile=inline  -> the response body is replaced by the text report
+#   _profile=1       -> the normal response is returned and the report is
+#                       written to PROFILE_OUTPUT_DIR (name in X-Profile-Report,
+#                       default ~/.cache/request-profiles, private to the
+#                       app's user)
+#   _profile_top=N   -> number of functions listed (default PROFILE_TOP_N / 30)
+#
+# Phases timed with metrics.timed_phase (db_query, transform, ...) are listed
+# at the top of the report.
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import secrets
+import threading
+import time
+
+from flask import Response, g, request
+
+DEFAULT_TOP_N = 30
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'request-profiles')
+
+# Query parameters that control profiling - not carried into OData nextLinks,
+# so only the requested page is profiled
+PROFILE_PARAMS = ('_profile', '_profile_top')
+
+# Only one profiler can be active per process (Python 3.12+ enforces this)
+_profiler_lock = threading.Lock()
+
+def _is_authorized():
+    """Check the request carries the profiling secret
+
+    Only the header is accepted - a query parameter would end up in access
+    logs, saved reports and OData nextLinks.
+    """
+    secret = os.getenv('PROFILE_SECRET')
+    if not secret:
+        return False
+    supplied = request.headers.get('X-Profile-Secret', '')
+    return hmac.compare_digest(supplied.encode('utf-8'), secret.encode('utf-8'))
+
+def _output_dir(app):
+    """Create the report directory (owner-only) and refuse one owned by another user"""
+    output_dir = app.config.get('PROFILE_OUTPUT_DIR') or DEFAULT_OUTPUT_DIR
+    os.makedirs(output_dir, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid') and os.stat(output_dir).st_uid != os.getuid():
+        raise PermissionError(f"Profile directory {output_dir} is owned by another user")
+    return output_dir
+
+def _build_report(profiler, phases, elapsed, top_n):
+    """Format phase timings plus the top-N cumulative functions"""
+    out = io.StringIO()
+    out.write(f"Profile of {request.method} {request.full_path} ({request.endpoint})\n")
+    out.write(f"Total: {elapsed * 1000:.1f} ms\n\n")
+
+    if phases:
+        out.write("Phases:\n")
+        for phase, seconds in phases:
+            out.write(f"  {phase:<20} {seconds * 1000:10.1f} ms\n")
+        out.write("\n")
+
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(top_n)
+    return out.getvalue()
+
+def record_profile_phase(phase, seconds):
+    """Attach a phase timing to the report if this request is being profiled"""
+    phases = g.get('profile_phases')
+    if phases is not None:
+        phases.append((phase, seconds))
+
+def init_profiling(app):
+    """Register the opt-in profiler hooks on the app"""
+
+    @app.before_request
+    def start_profiler():
+        mode = request.args.get('_profile')
+        if not mode or not _is_authorized():
+            return
+        if not _profiler_lock.acquire(blocking=False):
+            g.profile_skipped = True
+            return
+        g.profile_mode = mode
+        g.profile_phases = []
+        g.profile_start = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def finish_profiler(response):
+        if g.get('profile_skipped'):
+            response.headers['X-Profile-Report'] = 'skipped (another request is being profiled)'
+            return response
+
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        _profiler_lock.release()
+
+        elapsed = time.perf_counter() - g.profile_start
+        top_n = request.args.get('_profile_top', app.config.get('PROFILE_TOP_N', DEFAULT_TOP_N), type=int)
+        report = _build_report(profiler, g.profile_phases, elapsed, top_n)
+
+        if g.profile_mode == 'inline':
+            return Response(report, mimetype='text/plain', headers={'Cache-Control': 'no-store'})
+
+        # Store the raw stats (for snakeviz etc.) and the text report
+        try:
+            output_dir = _output_dir(app)
+        except OSError as e:
+            print(f"Error writing profile: {str(e)}")  # Debug log
+            response.headers['X-Profile-Report'] = 'failed (see server log)'
+            return response
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request.endpoint or 'unknown'}-{secrets.token_hex(4)}"
+        profiler.dump_stats(os.path.join(output_dir, f"{name}.prof"))
+        with open(os.path.join(output_dir, f"{name}.txt"), 'x', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Profile written to {os.path.join(output_dir, name)}.txt")  # Debug log
+
+        response.headers['X-Profile-Report'] = f"{name}.txt"
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # The view raised before after_request ran - don't leave the profiler on
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
+
+    return app
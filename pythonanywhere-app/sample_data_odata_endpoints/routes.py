@@ -51,21 +51,24 @@ def service_doc():
         }
     )
 
-@sample_data_bp.route("/SampleData")
-def sample_data():
-    """OData v4 Data endpoint with sample data"""
-    # Sample data using ISO date format for Tableau compatibility
-    data = [
-        {"Date": "2025-12-15", "Value": 41},
-        {"Date": "2025-12-16", "Value": 52},
-        {"Date": "2025-12-17", "Value": 27},
-        {"Date": "2025-12-18", "Value": 33},
-        {"Date": "2025-12-19", "Value": 42},
-        {"Date": "2025-12-20", "Value": 41}
-    ]
+# Sample data using ISO date format for Tableau compatibility
+SAMPLE_DATA = [
+    {"Date": "2025-12-15", "Value": 41},
+    {"Date": "2025-12-16", "Value": 52},
+    {"Date": "2025-12-17", "Value": 27},
+    {"Date": "2025-12-18", "Value": 33},
+    {"Date": "2025-12-19", "Value": 42},
+    {"Date": "2025-12-20", "Value": 41}
+]
 
+def build_odata_response(args, url_root):
+    """Apply OData query options to the sample data and build the response payload
+    
+    Shared by the Flask view and the ASGI path (asgi.py). `args` is any mapping
+    of query parameters.
+    """
     # Apply OData query parameters
-    args = request.args
+    data = list(SAMPLE_DATA)
 
     # $filter - basic support for simple equality filters
     if '$filter' in args:
@@ -108,17 +111,24 @@ def sample_data():
     # $count - return count
     if '$count' in args and args['$count'].lower() == 'true':
         odata_response = {
-            "@odata.context": f"{request.url_root}sample_data/$metadata#SampleData",
+            "@odata.context": f"{url_root}sample_data/$metadata#SampleData",
             "@odata.count": len(data),
             "value": data
         }
     else:
         # OData response format
         odata_response = {
-            "@odata.context": f"{request.url_root}sample_data/$metadata#SampleData",
+            "@odata.context": f"{url_root}sample_data/$metadata#SampleData",
             "value": data
         }
 
+    return odata_response
+
+@sample_data_bp.route("/SampleData")
+def sample_data():
+    """OData v4 Data endpoint with sample data"""
+    odata_response = build_odata_response(request.args, request.url_root)
+
     return Response(
         json.dumps(odata_response),
         mimetype='application/json',
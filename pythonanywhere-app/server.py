@@ -1,12 +1,23 @@
 # Flask App - Portfolio Project Server
 # This server hosts multiple data visualization and API projects using Flask Blueprints
+#
+# Blueprints import their heavy dependencies (pandas, plotly, SQLAlchemy, ...) on
+# first use to keep worker reloads fast. Set WARM_UP_BLUEPRINTS=1 to import them
+# in the background right after startup instead; check the startup cost with
+# `python import_report.py`.
+
+import os
+import threading
 
 from flask import Flask, render_template
+from http_caching import init_http_caching
+from metrics import init_metrics
+from profiling import init_profiling
 
 # Import project blueprints
-from covid_by_county.routes import covid_bp
+from covid_by_county.routes import covid_bp, warm_up as warm_up_covid
 from sample_data_odata_endpoints.routes import sample_data_bp
-from garmin_connect_odata_endpoints.routes import garmin_bp
+from garmin_connect_odata_endpoints.routes import garmin_bp, warm_up as warm_up_garmin
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -16,6 +27,25 @@ app.register_blueprint(covid_bp)
 app.register_blueprint(sample_data_bp)
 app.register_blueprint(garmin_bp)
 
+# Request metrics at /metrics (registered before caching so payload sizes are
+# recorded after compression - after_request handlers run in reverse order)
+init_metrics(app)
+
+# Compression, ETags and Cache-Control for every blueprint's responses
+init_http_caching(app)
+
+# Opt-in cProfile of a single request (only when PROFILE_SECRET is set)
+init_profiling(app)
+
+def warm_up():
+    """Import every blueprint's heavy dependencies ahead of the first request"""
+    warm_up_covid()
+    warm_up_garmin()
+
+if os.getenv('WARM_UP_BLUEPRINTS'):
+    # Don't block startup - the landing page can be served while this runs
+    threading.Thread(target=warm_up, name='blueprint-warm-up', daemon=True).start()
+
 # Portfolio landing page
 @app.route("/")
 def portfolio_landing_page():
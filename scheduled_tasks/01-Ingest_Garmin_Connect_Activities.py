@@ -5,6 +5,12 @@ This script fetches activity data from Garmin Connect API and either:
 1. Writes the data to a MySQL database (default behavior)
 2. Generates a schema analysis file for DDL creation (with --schema-only flag)
 
+Each fetched page is spooled to disk (see activity_spool.py) before the next
+one is requested. If a run dies part way, rerunning it resumes from the last
+completed page (unless the run is older than --max-resume-age hours), and the
+database load streams from the spool one page at a time, skipping activities
+that a resumed page repeated.
+
 USAGE:
 ------
 Default mode (fetch activities and write to database):
@@ -13,38 +19,59 @@ Default mode (fetch activities and write to database):
 Schema generation mode (fetch activities and generate schema analysis only):
     python "01 - Ingest Garmin Connect Activities.py" --schema-only
 
+To profile activities that are already spooled or staged without fetching,
+run schema_profiler.py directly.
+
+Discard a partial run in the spool and start over:
+    python "01 - Ingest Garmin Connect Activities.py" --fresh
+
+Schema runs never leave a pending load behind: the next default run starts
+a new fetch instead of loading the profiled snapshot.
+
+Multi-year backfill (more than the default 5 pages of 1,000):
+    python "01 - Ingest Garmin Connect Activities.py" --max-pages 20
+
 REQUIREMENTS:
 -------------
-- Environment variables: GARMIN_EMAIL and GARMIN_PASSWORD must be set
+- Environment variables: GARMIN_EMAIL and GARMIN_PASSWORD must be set (used
+  only when the saved tokens in GARMINTOKENS / ~/.garminconnect are missing
+  or no longer valid)
 - Database connection configured via db_connection module (for default mode)
 - Required packages: sqlalchemy, pandas, garminconnect
 
 OUTPUT:
 -------
 - Default mode: Writes activities to ingested_garmin_connect_activities table
-- Schema mode: Creates activities_schema_analysis.txt in the current directory
+- Schema mode: Creates activities_schema_analysis.txt and activities_schema_analysis.json
+  (column stats, suggested MySQL types, CREATE TABLE) in the current directory
+- Both modes: Spooled pages + manifest.json in GARMIN_SPOOL_DIR
+  (default scheduled_tasks/spool/activities)
 """
 
 from sqlalchemy import text
-import pandas as pd
-import json
 import sys
 import os
 import argparse
 
-from garminconnect import (
-    Garmin,
-    GarminConnectAuthenticationError,
-    GarminConnectTooManyRequestsError,
-    GarminConnectConnectionError
-)
-
 # ============================================================================
 # CLI ARGUMENTS: Parse command line arguments
 # ============================================================================
 parser = argparse.ArgumentParser(description='Ingest Garmin Connect activities')
 parser.add_argument('--schema-only', action='store_true',
                     help='Generate schema analysis file only, do not write to database')
+parser.add_argument('--sample', type=int, default=None,
+                    help='With --schema-only, profile a reservoir sample of this many activities')
+parser.add_argument('--fresh', action='store_true',
+                    help='Discard any partial run in the spool instead of resuming it')
+parser.add_argument('--max-pages', type=int, default=5,
+                    help='Maximum number of pages to fetch (default: 5)')
+parser.add_argument('--page-size', type=int, default=1000,
+                    help='Activities per page (default: 1000, the API limit)')
+parser.add_argument('--max-resume-age', type=float, default=float(os.getenv('GARMIN_SPOOL_MAX_AGE_HOURS', 12)),
+                    help='Start over instead of resuming a run older than this many hours '
+                         '(default: GARMIN_SPOOL_MAX_AGE_HOURS or 12)')
+parser.add_argument('--spool-dir', default=None,
+                    help='Spool directory (default: GARMIN_SPOOL_DIR or scheduled_tasks/spool/activities)')
 args = parser.parse_args()
 
 # ============================================================================
@@ -60,122 +87,103 @@ except NameError:
 
 sys.path.insert(0, parent_dir)
 from db_connection import is_database_available, get_db_engine
+from activity_spool import (
+    DEFAULT_SPOOL_DIR, clear_spool, iter_pages, load_manifest, manifest_age_hours, new_manifest,
+    save_manifest, spooled_activity_ids, to_staging_frame, write_page
+)
+from garmin_auth import get_garmin_client
 
 # ============================================================================
-# AUTHENTICATION: Setup Garmin Connect credentials and login
+# CHECKPOINT: Resume the run in the spool, or start a new one
 # ============================================================================
-# Get credentials from environment variables
-username = os.getenv('GARMIN_EMAIL')
-password = os.getenv('GARMIN_PASSWORD')
-print("Using environment variables for Garmin Connect authentication")
+spool_dir = args.spool_dir or DEFAULT_SPOOL_DIR
+manifest = load_manifest(spool_dir)
+
+if manifest is not None and not args.fresh and not manifest['loaded'] and not manifest.get('schema_only'):
+    age = manifest_age_hours(manifest)
+    if age > args.max_resume_age:
+        print(f"Not resuming run started {manifest['started_at']} ({age:.1f} hours old, --max-resume-age {args.max_resume_age:g})")
+        manifest = None
+
+if (args.fresh or manifest is None or manifest['loaded'] or manifest.get('schema_only')
+        or manifest['page_size'] != args.page_size):
+    # The last run finished, was a schema-only snapshot, is too old or is being discarded - start over
+    clear_spool(spool_dir)
+    manifest = new_manifest(args.page_size)
+    save_manifest(manifest, spool_dir)
+    print(f"Starting a new run in spool {spool_dir}")
+else:
+    fetched = sum(entry['count'] for entry in manifest['pages'])
+    print(f"Resuming run started {manifest['started_at']}: {len(manifest['pages'])} pages ({fetched} activities) already spooled")
 
-# Login to Garmin Connect
-try:
-    client = Garmin(username, password)
-    client.login()
-    print("Login successful!")
-except GarminConnectAuthenticationError:
-    print("Authentication error. Check your credentials.")
-except GarminConnectTooManyRequestsError:
-    print("Too many requests. Try again later.")
-except GarminConnectConnectionError:
-    print("Connection error. Check your internet connection.")
+# ============================================================================
+# AUTHENTICATION: Setup Garmin Connect credentials and login
+# ============================================================================
+# Reuses the tokens saved by the previous run (see garmin_auth.py) and only
+# logs in with GARMIN_EMAIL / GARMIN_PASSWORD when they are missing or invalid
+if not manifest['fetch_complete']:
+    client = get_garmin_client()
+    if client is None:
+        print("Could not log in to Garmin Connect - rerun to resume")
+        sys.exit(1)
 
 # ============================================================================
 # DATA EXTRACTION: Retrieve activities from Garmin Connect Python Wrapper API
 # ============================================================================
-# Fetch up to 5,000 activities in batches of 1,000 (API limitation)
-all_activities = []
-batch_size = 1000
-num_batches = 5
+# Fetch pages of 1,000 activities (API limitation), spooling each one before
+# requesting the next. A short page means there are no more activities.
+batch_size = manifest['page_size']
 
-for i in range(num_batches):
+while not manifest['fetch_complete'] and len(manifest['pages']) < args.max_pages:
+    i = len(manifest['pages'])
     start_index = i * batch_size
     print(f"Fetching activities {start_index} to {start_index + batch_size - 1}...")
     try:
         batch_activities = client.get_activities(start_index, batch_size)
-        all_activities.extend(batch_activities)
-        print(f"Retrieved {len(batch_activities)} activities in batch {i+1}")
     except Exception as e:
         print(f"Error fetching batch {i+1}: {e}")
-        break
+        print(f"{i} pages are kept in the spool - rerun to resume from batch {i+1}")
+        sys.exit(1)
 
-print(f"Total activities retrieved: {len(all_activities)}")
-activities_df = pd.DataFrame(all_activities)
+    # Activities recorded since the run started shift the pages, so a resumed
+    # page can repeat spooled activities (they're skipped on load)
+    already_spooled = spooled_activity_ids(manifest)
+    repeated = sum(1 for activity in batch_activities if activity.get('activityId') in already_spooled)
 
-# ============================================================================
-# DATA TRANSFORMATION: Convert complex types to JSON strings
-# ============================================================================
-# Convert dict/list columns to JSON strings to avoid insertion errors
-for col in activities_df.columns:
-    if activities_df[col].apply(lambda x: isinstance(x, (dict, list))).any():
-        activities_df[col] = activities_df[col].apply(
-            lambda x: json.dumps(x) if isinstance(x, (dict, list)) else x
-        )
+    write_page(manifest, batch_activities, spool_dir)
+    print(f"Retrieved {len(batch_activities)} activities in batch {i+1}")
+    if repeated:
+        print(f"{repeated} of them were already spooled (new activities since the run started) and will be loaded once")
+    if len(batch_activities) < batch_size:
+        manifest['fetch_complete'] = True
+
+manifest['fetch_complete'] = True
+save_manifest(manifest, spool_dir)
+print(f"Total activities retrieved: {sum(entry['count'] for entry in manifest['pages'])}")
 
 # ============================================================================
 # SCHEMA INSPECTION: Analyze dataframe structure for DDL generation
 # ============================================================================
 if args.schema_only:
-    output_file = "activities_schema_analysis.txt"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write("="*80 + "\n")
-        f.write("DATAFRAME STRUCTURE ANALYSIS\n")
-        f.write("="*80 + "\n\n")
-        f.write(f"Shape: {activities_df.shape}\n")
-        f.write(f"Total Rows: {len(activities_df)}\n")
-        f.write(f"Total Columns: {len(activities_df.columns)}\n\n")
-        
-        f.write("="*80 + "\n")
-        f.write("COLUMN DATA TYPES\n")
-        f.write("="*80 + "\n")
-        f.write(str(activities_df.dtypes) + "\n\n")
-        
-        f.write("="*80 + "\n")
-        f.write("DETAILED COLUMN ANALYSIS\n")
-        f.write("="*80 + "\n\n")
-        
-        if len(activities_df) > 0:
-            for col in activities_df.columns:
-                f.write(f"\n{'='*80}\n")
-                f.write(f"Column: {col}\n")
-                f.write(f"{'='*80}\n")
-                
-                # Data type info
-                sample_value = activities_df[col].iloc[0]
-                value_type = type(sample_value).__name__
-                f.write(f"Python Type: {value_type}\n")
-                f.write(f"Pandas dtype: {activities_df[col].dtype}\n")
-                
-                # Null count
-                null_count = activities_df[col].isnull().sum()
-                f.write(f"Null Count: {null_count} ({null_count/len(activities_df)*100:.2f}%)\n")
-                
-                # Type-specific analysis
-                if value_type in ['dict', 'list']:
-                    f.write(f"Complex Type: {value_type}\n")
-                    f.write(f"Sample Value:\n{json.dumps(sample_value, indent=2)}\n")
-                elif value_type == 'str':
-                    max_len = activities_df[col].astype(str).str.len().max()
-                    f.write(f"Max Length: {max_len}\n")
-                    f.write(f"Sample Value: {sample_value}\n")
-                else:
-                    f.write(f"Sample Value: {sample_value}\n")
-                
-                # Show a few unique values if reasonable
-                unique_count = activities_df[col].nunique()
-                f.write(f"Unique Values: {unique_count}\n")
-                if unique_count <= 20 and value_type not in ['dict', 'list']:
-                    f.write(f"Unique Values List: {list(activities_df[col].unique())}\n")
-    
-    print(f"\nSchema analysis written to: {output_file}")
+    # This snapshot is for profiling only - the next default run fetches afresh
+    # instead of loading it
+    manifest['schema_only'] = True
+    save_manifest(manifest, spool_dir)
+
+    # Profile the spooled pages (see schema_profiler.py for the report format)
+    from schema_profiler import load_spool, profile_and_report
+
+    activities_df, total_rows = load_spool(args.sample, spool_dir)
+    profile_and_report(activities_df, 'spool', total_rows)
     print("Exiting without writing to database (--schema-only flag was used)")
     sys.exit(0)
 
 # ============================================================================
 # DATABASE WRITE: Connect to MySQL database and write data
 # ============================================================================
-# Connect to MySQL database and write data
+# Connect to MySQL database and stream the spooled pages into it, one page
+# (DataFrame) at a time. If the load fails, the rerun reloads from the spool
+# without fetching again.
 try:
     # Get database engine from shared module
     engine = get_db_engine()
@@ -185,16 +193,24 @@ try:
         connection.execute(text('TRUNCATE TABLE ingested_garmin_connect_activities'))
         print("Table truncated successfully")
     
-    # Write DataFrame to MySQL table
-    activities_df.to_sql(
-        name='ingested_garmin_connect_activities',
-        con=engine,
-        if_exists='append',
-        index=False,
-        chunksize=1000
-    )
+    # Write each page's DataFrame to MySQL table
+    total_records = 0
+    for page in iter_pages(manifest, spool_dir):
+        activities_df = to_staging_frame(page)
+        activities_df.to_sql(
+            name='ingested_garmin_connect_activities',
+            con=engine,
+            if_exists='append',
+            index=False,
+            chunksize=1000
+        )
+        total_records += len(activities_df)
     
-    print(f"Successfully wrote {len(activities_df)} records to MySQL database")
+    print(f"Successfully wrote {total_records} records to MySQL database")
+
+    # Next run starts a new fetch
+    manifest['loaded'] = True
+    save_manifest(manifest, spool_dir)
     
 except Exception as e:
     print(f"Error writing to database: {e}")
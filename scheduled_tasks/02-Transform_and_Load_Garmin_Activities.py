@@ -1,104 +1,51 @@
+"""
+Garmin Connect Activities Transform and Load Script
+
+Reads the raw activities from the ingested_garmin_connect_activities staging
+table, cleans/converts/enriches them and writes the analytics-ready rows to
+garmin_connect_activities.
+
+USAGE:
+------
+Default mode (load the whole staging table at once):
+    python "02 - Transform and Load Garmin Activities.py"
+
+Chunked mode (read only the needed columns, N rows at a time, and write each
+transformed chunk before reading the next - memory stays constant as the
+activity history grows):
+    python "02 - Transform and Load Garmin Activities.py" --chunksize 500
+"""
+
 from datetime import timedelta
-from sqlalchemy import text
+from sqlalchemy import MetaData, Table, select, text
 import pandas as pd
+import argparse
 import sys, os
 import math
+import json
 
 # ============================================================================
-# SETUP: Add parent directory to path for custom db_connection module import
+# CLI ARGUMENTS: Parse command line arguments
 # ============================================================================
-sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from db_connection import is_database_available, get_db_engine
+parser = argparse.ArgumentParser(description='Transform and load Garmin Connect activities')
+parser.add_argument('--chunksize', type=int, default=None,
+                    help='Process the staging table in chunks of this many rows')
+args = parser.parse_args()
 
 # ============================================================================
-# DATA EXTRACTION: Load ingested activities from MySQL database
+# SETUP: Add parent directory to path for custom db_connection module import
 # ============================================================================
-# Get database engine and load the ingested activities table
-engine = get_db_engine()
-query = "SELECT * FROM ingested_garmin_connect_activities"
-
-print("Loading activities from database...")
-activities_df = pd.read_sql(query, engine)
-print(f"Loaded {len(activities_df)} activities from ingested_garmin_connect_activities table")
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db_connection import is_database_available, get_db_engine
+from odata_counts import invalidate_entity_counts, publish_entity_counts
 
 # ============================================================================
-# JSON PARSING: Parse JSON string columns back to Python objects
+# COLUMN CONFIGURATION: JSON columns, output columns and their display names
 # ============================================================================
-import json
-
 # List of columns that contain JSON strings that need to be parsed
 json_columns = ['activityType', 'eventType', 'privacy', 'userRoles', 'summarizedDiveInfo', 
                 'splitSummaries', 'summarizedExerciseSets', 'unitOfPoolLength']
 
-for col in json_columns:
-    if col in activities_df.columns:
-        activities_df[col] = activities_df[col].apply(
-            lambda x: json.loads(x) if pd.notna(x) and x != '' else x
-        )
-
-print("JSON columns parsed successfully")
-
-# ============================================================================
-# TRANSFORMATION FUNCTIONS: Helper functions for data transformations
-# ============================================================================
-# Function to convert seconds to HH:MM:SS format
-def convert_to_elapsed_time(seconds):
-
-    return str(timedelta(seconds=seconds))
-
-# Function to add average weight per rep to each dictionary in the list
-def add_avg_weight_per_rep(exercise_sets):
-    
-    # check if the exercise_sets is a list
-    if type(exercise_sets) is not list:
-        return None
-    
-    for exercise in exercise_sets:
-        if exercise['reps'] > 0:
-            exercise['avg_weight_per_rep'] = math.ceil(exercise['volume'] * 0.00220462) / exercise['reps'] 
-        else:
-            exercise['avg_weight_per_rep'] = 0
-
-    return exercise_sets
-
-# ============================================================================
-# DATA TRANSFORMATION: Clean, transform, and format activity data
-# ============================================================================
-# DATA PREP ==> Cleaning/Transforming/Formating
-activities_df['duration'] = activities_df['duration'].fillna(0).apply(convert_to_elapsed_time)
-activities_df['elapsedDuration'] = activities_df['elapsedDuration'].fillna(0).apply(convert_to_elapsed_time)
-activities_df['movingDuration'] = activities_df['movingDuration'].fillna(0).apply(convert_to_elapsed_time)
-activities_df['activityType'] = activities_df['activityType'].apply(lambda x: x['typeKey'])
-activities_df['distance'] = activities_df['distance'].apply(lambda x: x * 0.000621371)
-activities_df['activityType'] = activities_df['activityType'].apply(lambda x: x.replace('_', ' ').title())
-activities_df['privacy'] = activities_df['privacy'].apply(lambda x: x['typeKey'])
-activities_df['minTemperature'] = activities_df['minTemperature'].apply(lambda x: x * 9/5 + 32)
-activities_df['maxTemperature'] = activities_df['maxTemperature'].apply(lambda x: x * 9/5 + 32)
-
-# DATA ENRICHMENT ==> Modify summarized exercise sets by adding in average weight lifted per rep
-activities_df['summarizedExerciseSets'] = activities_df['summarizedExerciseSets'].apply(add_avg_weight_per_rep)
-
-# Extract the first item from the list in the 'Summarized Exercise Sets' column
-activities_df['First Exercise Set'] = activities_df['summarizedExerciseSets'].apply(lambda x: x[0] if isinstance(x, list) and len(x) > 0 else {})
-
-# Normalize the JSON data in the 'First Exercise Set' column
-#   -> Drop the category, subcategory, and duration columns
-exercise_sets_df = pd.json_normalize(activities_df['First Exercise Set'])
-exercise_sets_df.drop(columns=['category', 'subCategory', 'duration'], inplace=True)
-exercise_sets_df['volume'] = exercise_sets_df['volume'].fillna(0)
-exercise_sets_df['volume'] = exercise_sets_df['volume'].apply(lambda x: math.ceil(x * 0.00220462))
-
-# Add the normalized data to the original DataFrame and drop the 'First Exercise Set' column
-activities_df = pd.concat([activities_df, exercise_sets_df], axis=1)
-activities_df.drop(columns=['First Exercise Set'], inplace=True)
-
-# Create a DataFrame with the dummy rows
-dummy_rows = pd.DataFrame([
-    {'activityType': 'Running', 'startTimeLocal': '2022-01-03T00:00:00.000Z', 'distance': 0},
-    {'activityType': 'Running', 'startTimeLocal': '2025-12-30T00:00:00.000Z', 'distance': 0}
-])
-activities_df = pd.concat([activities_df, dummy_rows], ignore_index=True)
-
 # Column headers to rename and select (STORE THIS IN A JSON FILE!!!)
 renaming_dict = {
     'activityType': 'Activity Type',
@@ -161,24 +108,108 @@ renaming_dict = {
     'maxStress': 'Max Stress'
 }
 
-# Subset the data to only show the columns we want
-activities_df = activities_df[renaming_dict.keys()]
+# Columns built from summarizedExerciseSets rather than read from the staging table
+exercise_set_columns = ['reps', 'volume', 'sets', 'avg_weight_per_rep']
 
-# Rename the columns
-activities_df.rename(columns=renaming_dict, inplace=True)
+# Staging columns the transformation actually reads
+source_columns = [col for col in renaming_dict if col not in exercise_set_columns] + ['summarizedExerciseSets']
 
-# Connect to MySQL database and write data
-try:
-    # Get database engine from shared module
-    engine = get_db_engine()
+# ============================================================================
+# TRANSFORMATION FUNCTIONS: Helper functions for data transformations
+# ============================================================================
+# Function to convert seconds to HH:MM:SS format
+def convert_to_elapsed_time(seconds):
+
+    return str(timedelta(seconds=seconds))
+
+# Function to add average weight per rep to each dictionary in the list
+def add_avg_weight_per_rep(exercise_sets):
+    
+    # check if the exercise_sets is a list
+    if type(exercise_sets) is not list:
+        return None
     
-    # Truncate the table before inserting new data
+    for exercise in exercise_sets:
+        if exercise['reps'] > 0:
+            exercise['avg_weight_per_rep'] = math.ceil(exercise['volume'] * 0.00220462) / exercise['reps'] 
+        else:
+            exercise['avg_weight_per_rep'] = 0
+
+    return exercise_sets
+
+# Function to select and rename the output columns (columns a chunk doesn't have are left empty)
+def select_output_columns(activities_df):
+
+    return activities_df.reindex(columns=list(renaming_dict.keys())).rename(columns=renaming_dict)
+
+# ============================================================================
+# DATA TRANSFORMATION: Clean, transform, and format activity data
+# ============================================================================
+# Transforms one DataFrame of staging rows (the whole table, or one chunk)
+def transform_activities(activities_df):
+
+    activities_df = activities_df.reset_index(drop=True)
+
+    # JSON PARSING ==> Parse JSON string columns back to Python objects
+    for col in json_columns:
+        if col in activities_df.columns:
+            activities_df[col] = activities_df[col].apply(
+                lambda x: json.loads(x) if pd.notna(x) and x != '' else x
+            )
+
+    # DATA PREP ==> Cleaning/Transforming/Formating
+    activities_df['duration'] = activities_df['duration'].fillna(0).apply(convert_to_elapsed_time)
+    activities_df['elapsedDuration'] = activities_df['elapsedDuration'].fillna(0).apply(convert_to_elapsed_time)
+    activities_df['movingDuration'] = activities_df['movingDuration'].fillna(0).apply(convert_to_elapsed_time)
+    activities_df['activityType'] = activities_df['activityType'].apply(lambda x: x['typeKey'])
+    activities_df['distance'] = activities_df['distance'].apply(lambda x: x * 0.000621371)
+    activities_df['activityType'] = activities_df['activityType'].apply(lambda x: x.replace('_', ' ').title())
+    activities_df['privacy'] = activities_df['privacy'].apply(lambda x: x['typeKey'])
+    activities_df['minTemperature'] = activities_df['minTemperature'].apply(lambda x: x * 9/5 + 32)
+    activities_df['maxTemperature'] = activities_df['maxTemperature'].apply(lambda x: x * 9/5 + 32)
+
+    # DATA ENRICHMENT ==> Modify summarized exercise sets by adding in average weight lifted per rep
+    activities_df['summarizedExerciseSets'] = activities_df['summarizedExerciseSets'].apply(add_avg_weight_per_rep)
+
+    # Extract the first item from the list in the 'Summarized Exercise Sets' column
+    activities_df['First Exercise Set'] = activities_df['summarizedExerciseSets'].apply(lambda x: x[0] if isinstance(x, list) and len(x) > 0 else {})
+
+    # Normalize the JSON data in the 'First Exercise Set' column
+    #   -> Drop the category, subcategory, and duration columns
+    #   -> A chunk without strength activities has none of these columns
+    exercise_sets_df = pd.json_normalize(activities_df['First Exercise Set'])
+    exercise_sets_df.drop(columns=['category', 'subCategory', 'duration'], inplace=True, errors='ignore')
+    if 'volume' not in exercise_sets_df.columns:
+        exercise_sets_df['volume'] = 0
+    exercise_sets_df['volume'] = exercise_sets_df['volume'].fillna(0)
+    exercise_sets_df['volume'] = exercise_sets_df['volume'].apply(lambda x: math.ceil(x * 0.00220462))
+
+    # Add the normalized data to the original DataFrame and drop the 'First Exercise Set' column
+    activities_df = pd.concat([activities_df, exercise_sets_df], axis=1)
+    activities_df.drop(columns=['First Exercise Set'], inplace=True)
+
+    # Subset the data to only show the columns we want, and rename them
+    return select_output_columns(activities_df)
+
+# Create a DataFrame with the dummy rows
+dummy_rows = select_output_columns(pd.DataFrame([
+    {'activityType': 'Running', 'startTimeLocal': '2022-01-03T00:00:00.000Z', 'distance': 0},
+    {'activityType': 'Running', 'startTimeLocal': '2025-12-30T00:00:00.000Z', 'distance': 0}
+]))
+
+# Function to empty the analytics table before it is reloaded
+def truncate_activities(engine):
+
+    # The OData service counts rows itself until the reload is published
+    invalidate_entity_counts(engine, ['activities'])
+
     with engine.begin() as connection:
         connection.execute(text('TRUNCATE TABLE garmin_connect_activities'))
-        #connection.commit()
         print("Table truncated successfully")
-    
-    # Write DataFrame to MySQL table
+
+# Function to append a DataFrame to the analytics table
+def write_activities(activities_df, engine):
+
     activities_df.to_sql(
         name='garmin_connect_activities',
         con=engine,
@@ -186,10 +217,61 @@ try:
         index=False,
         chunksize=1000
     )
+
+# ============================================================================
+# TRANSFORM AND LOAD: Read the staging table, transform and write to MySQL
+# ============================================================================
+# Connect to MySQL database and write data
+try:
+    # Get database engine from shared module
+    engine = get_db_engine()
+
+    if args.chunksize:
+        # Chunked mode ==> only the columns the transformation reads, streamed
+        # from the server and written out chunk by chunk. The table has to be
+        # emptied before the first chunk is written, so a transform error part
+        # way leaves it partially loaded until the next run.
+        truncate_activities(engine)
+
+        staging_table = Table('ingested_garmin_connect_activities', MetaData(), autoload_with=engine)
+        query = select(*[staging_table.c[col] for col in source_columns if col in staging_table.c])
+
+        print(f"Loading activities from database in chunks of {args.chunksize}...")
+        total_records = 0
+        with engine.connect().execution_options(stream_results=True) as connection:
+            for i, chunk_df in enumerate(pd.read_sql(query, connection, chunksize=args.chunksize)):
+                activities_df = transform_activities(chunk_df)
+                write_activities(activities_df, engine)
+                total_records += len(activities_df)
+                print(f"Wrote chunk {i+1} ({len(activities_df)} records)")
+        print(f"Loaded {total_records} activities from ingested_garmin_connect_activities table")
+
+        write_activities(dummy_rows, engine)
+        total_records += len(dummy_rows)
+    else:
+        # DATA EXTRACTION ==> Load the whole ingested activities table
+        query = "SELECT * FROM ingested_garmin_connect_activities"
+
+        print("Loading activities from database...")
+        activities_df = pd.read_sql(query, engine)
+        print(f"Loaded {len(activities_df)} activities from ingested_garmin_connect_activities table")
+
+        activities_df = transform_activities(activities_df)
+        activities_df = pd.concat([activities_df, dummy_rows], ignore_index=True)
+
+        # Only truncate once the transform has succeeded, so a bad staging row
+        # never leaves the analytics table empty
+        truncate_activities(engine)
+
+        # Write DataFrame to MySQL table
+        write_activities(activities_df, engine)
+        total_records = len(activities_df)
     
-    print(f"Successfully wrote {len(activities_df)} records to MySQL database")
+    print(f"Successfully wrote {total_records} records to MySQL database")
+
+    # Cheap $count answers for the OData service
+    publish_entity_counts(engine, {'activities': total_records})
     
 except Exception as e:
     print(f"Error writing to database: {e}")
     raise
-
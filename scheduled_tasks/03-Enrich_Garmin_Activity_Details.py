@@ -0,0 +1,359 @@
+"""
+Garmin Connect Activity Details Enrichment Script
+
+Optional third stage of the pipeline. The list endpoint used by 01 - Ingest
+only returns summary fields, so this script fetches the per-activity detail
+endpoints - laps (get_activity_splits) and split summaries
+(get_activity_split_summaries) - and loads them into normalized child tables
+keyed by activityId, which the OData service exposes as the laps and splits
+entity sets.
+
+Only activities that aren't in the on-disk cache yet are fetched, using a
+bounded pool of worker threads (each with its own Garmin Connect session).
+Each response is cached as <cache dir>/<activityId>.json.gz and never fetched
+again, so a daily run costs two requests per new activity.
+
+The child tables are loaded incrementally: only cached activities that aren't
+recorded in garmin_connect_activity_details_loaded yet are inserted (those
+without laps or splits are recorded too), and rows of activities no longer in
+the staging table are removed - unless the staging table is empty or 01's
+last load didn't finish. A run that changes nothing leaves the published
+entity counts alone. --full-reload truncates the tables and reloads every
+cached activity instead (after changing the column mapping, for example).
+
+USAGE:
+------
+Fetch details for new activities and reload the child tables:
+    python "03 - Enrich Garmin Activity Details.py"
+
+Initial backfill, 8 parallel requests, at most 500 activities per run:
+    python "03 - Enrich Garmin Activity Details.py" --workers 8 --limit 500
+
+Rebuild both child tables from the cache:
+    python "03 - Enrich Garmin Activity Details.py" --full-reload
+
+REQUIREMENTS:
+-------------
+- 01 - Ingest Garmin Connect Activities.py has loaded ingested_garmin_connect_activities
+- Garmin Connect login (token store or GARMIN_EMAIL / GARMIN_PASSWORD, see garmin_auth.py)
+- Tables garmin_connect_activity_laps, garmin_connect_activity_splits and
+  garmin_connect_activity_details_loaded (DDL in scheduled_tasks/README.md)
+
+OUTPUT:
+-------
+- Cache files in GARMIN_DETAILS_CACHE_DIR (default scheduled_tasks/spool/details)
+- Rows in garmin_connect_activity_laps and garmin_connect_activity_splits
+- One row per loaded activity in garmin_connect_activity_details_loaded
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import bindparam, text
+import pandas as pd
+import argparse
+import contextlib
+import gzip
+import json
+import sys, os
+import tempfile
+import threading
+import time
+
+from garminconnect import GarminConnectTooManyRequestsError
+
+# ============================================================================
+# CLI ARGUMENTS: Parse command line arguments
+# ============================================================================
+parser = argparse.ArgumentParser(description='Fetch and load Garmin Connect activity details')
+parser.add_argument('--workers', type=int, default=4,
+                    help='Number of parallel detail requests (default: 4)')
+parser.add_argument('--limit', type=int, default=None,
+                    help='Fetch details for at most this many new activities')
+parser.add_argument('--cache-dir', default=None,
+                    help='Detail cache directory (default: GARMIN_DETAILS_CACHE_DIR or scheduled_tasks/spool/details)')
+parser.add_argument('--fetch-only', action='store_true',
+                    help='Fill the cache without loading the child tables')
+parser.add_argument('--full-reload', action='store_true',
+                    help='Truncate the child tables and reload every cached activity')
+args = parser.parse_args()
+
+# ============================================================================
+# SETUP: Add parent directory to path for custom db_connection module import
+# ============================================================================
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_db_engine
+from garmin_auth import get_garmin_client, login_with_tokens
+from activity_spool import load_manifest
+from odata_counts import invalidate_entity_counts, publish_entity_counts
+
+cache_dir = args.cache_dir or os.getenv(
+    'GARMIN_DETAILS_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool', 'details')
+)
+os.makedirs(cache_dir, exist_ok=True)
+
+# ============================================================================
+# COLUMN CONFIGURATION: Detail fields loaded into the child tables
+# ============================================================================
+# lapDTOs from get_activity_splits -> garmin_connect_activity_laps
+lap_columns = {
+    'lapIndex': 'LapIndex',
+    'startTimeGMT': 'StartTimeGMT',
+    'distance': 'DistanceMiles',
+    'duration': 'DurationSeconds',
+    'movingDuration': 'MovingDurationSeconds',
+    'elevationGain': 'ElevationGainMeters',
+    'elevationLoss': 'ElevationLossMeters',
+    'averageSpeed': 'AverageSpeed',
+    'maxSpeed': 'MaxSpeed',
+    'averageHR': 'AverageHR',
+    'maxHR': 'MaxHR',
+    'averageRunCadence': 'AverageRunCadence',
+    'maxRunCadence': 'MaxRunCadence',
+    'strideLength': 'StrideLength',
+    'calories': 'Calories'
+}
+
+# splitSummaries from get_activity_split_summaries -> garmin_connect_activity_splits
+split_columns = {
+    'splitType': 'SplitType',
+    'noOfSplits': 'NumberOfSplits',
+    'distance': 'DistanceMiles',
+    'duration': 'DurationSeconds',
+    'movingDuration': 'MovingDurationSeconds',
+    'elevationGain': 'ElevationGainMeters',
+    'elevationLoss': 'ElevationLossMeters',
+    'averageSpeed': 'AverageSpeed',
+    'maxSpeed': 'MaxSpeed',
+    'averageHR': 'AverageHR',
+    'maxHR': 'MaxHR',
+    'calories': 'Calories'
+}
+
+# ============================================================================
+# CACHE FUNCTIONS: One gzip JSON file per activity
+# ============================================================================
+def cache_path(activity_id):
+
+    return os.path.join(cache_dir, f"{activity_id}.json.gz")
+
+def cached_activity_ids():
+
+    return {int(name.split('.')[0]) for name in os.listdir(cache_dir) if name.endswith('.json.gz')}
+
+def write_cache(activity_id, details):
+
+    # Written to a temp file first so a crash never leaves a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(gzip.compress(json.dumps(details).encode('utf-8')))
+    os.replace(tmp_path, cache_path(activity_id))
+
+def read_cache(activity_id):
+
+    with gzip.open(cache_path(activity_id), 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+# ============================================================================
+# ACTIVITY IDS: Activities in the staging table without cached details
+# ============================================================================
+engine = get_db_engine()
+activity_ids = pd.read_sql("SELECT activityId FROM ingested_garmin_connect_activities", engine)['activityId']
+# Deduplicated, in staging order
+activity_ids = list(dict.fromkeys(int(activity_id) for activity_id in activity_ids.dropna()))
+
+cached_ids = cached_activity_ids()
+new_ids = [activity_id for activity_id in activity_ids if activity_id not in cached_ids]
+if args.limit is not None:
+    new_ids = new_ids[:args.limit]
+print(f"{len(activity_ids)} activities, {len(cached_ids)} with cached details, fetching {len(new_ids)}")
+
+# ============================================================================
+# DATA EXTRACTION: Fetch details for new activities with a bounded pool
+# ============================================================================
+# A garth client (requests.Session plus OAuth2 token refresh) isn't safe to
+# share between threads, so each worker logs in from the token store that
+# get_garmin_client() just saved and keeps its own client. If that fails,
+# workers share the main client one request at a time.
+worker_state = threading.local()
+shared_client_lock = threading.Lock()
+
+def worker_client():
+
+    if not hasattr(worker_state, 'client'):
+        worker_state.client = login_with_tokens()
+    return worker_state.client
+
+def fetch_details(activity_id):
+
+    own_client = worker_client()
+    lock = shared_client_lock if own_client is None else contextlib.nullcontext()
+    with lock:
+        fetch_client = own_client or client
+        splits = fetch_client.get_activity_splits(activity_id)
+        split_summaries = fetch_client.get_activity_split_summaries(activity_id)
+    details = {
+        'activityId': activity_id,
+        'fetched_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'splits': splits,
+        'split_summaries': split_summaries,
+    }
+    write_cache(activity_id, details)
+
+if new_ids:
+    client = get_garmin_client()
+    if client is None:
+        print("Could not log in to Garmin Connect")
+        sys.exit(1)
+
+    fetched = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(fetch_details, activity_id): activity_id for activity_id in new_ids}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                fetched += 1
+                if fetched % 100 == 0:
+                    print(f"Fetched details for {fetched} of {len(new_ids)} activities")
+            except GarminConnectTooManyRequestsError:
+                # Stop queuing requests - the rest are fetched on the next run
+                print("Too many requests. Stopping; remaining activities will be fetched on the next run.")
+                executor.shutdown(wait=True, cancel_futures=True)
+                break
+            except Exception as e:
+                # Not cached, so it is retried on the next run
+                failed += 1
+                print(f"Error fetching details for activity {futures[future]}: {e}")
+
+    print(f"Fetched details for {fetched} activities ({failed} failed)")
+
+if args.fetch_only:
+    print("Exiting without loading the child tables (--fetch-only flag was used)")
+    sys.exit(0)
+
+# ============================================================================
+# DATA TRANSFORMATION: Normalize cached details into child table rows
+# ============================================================================
+def normalize(records, columns, activity_id):
+
+    df = pd.json_normalize(records) if records else pd.DataFrame()
+    df = df.reindex(columns=list(columns.keys())).rename(columns=columns)
+    df.insert(0, 'ActivityId', activity_id)
+    df['DistanceMiles'] = df['DistanceMiles'] * 0.000621371
+    return df
+
+def detail_frames(activity_ids_batch):
+
+    laps, splits = [], []
+    for activity_id in activity_ids_batch:
+        details = read_cache(activity_id)
+        laps.append(normalize((details.get('splits') or {}).get('lapDTOs') or [], lap_columns, activity_id))
+        splits.append(normalize((details.get('split_summaries') or {}).get('splitSummaries') or [], split_columns, activity_id))
+    return pd.concat(laps, ignore_index=True), pd.concat(splits, ignore_index=True)
+
+# ============================================================================
+# DATABASE WRITE: Load new activities into the child tables
+# ============================================================================
+# garmin_connect_activity_details_loaded records every loaded activity, so
+# activities without laps or splits (strength, yoga, manual entries) count as
+# loaded too. Only activities still in the staging table are loaded, in
+# batches so memory stays bounded however many activities are cached. Each
+# batch is one transaction (delete + insert + marker), so an activity is never
+# half loaded.
+detail_tables = ('garmin_connect_activity_laps', 'garmin_connect_activity_splits', 'garmin_connect_activity_details_loaded')
+
+def loaded_activity_ids():
+
+    return set(pd.read_sql("SELECT ActivityId FROM garmin_connect_activity_details_loaded", engine)['ActivityId'].astype(int))
+
+def staging_complete():
+
+    # 01 truncates the staging table before streaming the spool into it, so a
+    # run that fetched everything but never finished loading may have left it
+    # partial
+    manifest = load_manifest()
+    if manifest is None or manifest.get('schema_only'):
+        return True
+    return not manifest.get('fetch_complete') or manifest.get('loaded', False)
+
+def delete_activities(connection, ids):
+
+    for table in detail_tables:
+        connection.execute(
+            text(f"DELETE FROM {table} WHERE ActivityId IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': ids}
+        )
+
+def table_count(connection, table):
+
+    return connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+cached_ids = cached_activity_ids()
+batch_size = 500
+
+try:
+    if args.full_reload:
+        loaded_ids = set()
+        removed_ids = []
+    else:
+        loaded_ids = loaded_activity_ids()
+        # An empty or partial staging table would wipe the child tables
+        if not activity_ids:
+            print("Staging table is empty - not removing details of missing activities")
+            removed_ids = []
+        elif not staging_complete():
+            print("01 - Ingest hasn't finished loading the staging table - not removing details of missing activities")
+            removed_ids = []
+        else:
+            removed_ids = sorted(loaded_ids - set(activity_ids))
+        loaded_ids -= set(removed_ids)
+
+    load_ids = [activity_id for activity_id in activity_ids if activity_id in cached_ids and activity_id not in loaded_ids]
+    print(f"Loading details of {len(load_ids)} activities ({len(loaded_ids)} already loaded)")
+
+    if not (args.full_reload or removed_ids or load_ids):
+        # Nothing changed - keep the published counts (and their data version)
+        print("Child tables are up to date")
+        sys.exit(0)
+
+    # The OData service counts rows itself until the load is published
+    invalidate_entity_counts(engine, ['laps', 'splits'])
+
+    if args.full_reload:
+        with engine.begin() as connection:
+            for table in detail_tables:
+                connection.execute(text(f'TRUNCATE TABLE {table}'))
+            print("Tables truncated successfully")
+
+    # Drop activities that are no longer in the staging table
+    with engine.begin() as connection:
+        for start in range(0, len(removed_ids), batch_size):
+            delete_activities(connection, removed_ids[start:start + batch_size])
+    if removed_ids:
+        print(f"Removed details of {len(removed_ids)} activities no longer in the staging table")
+
+    lap_count = 0
+    split_count = 0
+    for start in range(0, len(load_ids), batch_size):
+        batch_ids = load_ids[start:start + batch_size]
+        laps_df, splits_df = detail_frames(batch_ids)
+        loaded_df = pd.DataFrame({'ActivityId': batch_ids, 'LoadedAt': pd.Timestamp.now().floor('s')})
+        with engine.begin() as connection:
+            delete_activities(connection, batch_ids)
+            laps_df.to_sql(name='garmin_connect_activity_laps', con=connection, if_exists='append', index=False, chunksize=1000)
+            splits_df.to_sql(name='garmin_connect_activity_splits', con=connection, if_exists='append', index=False, chunksize=1000)
+            loaded_df.to_sql(name='garmin_connect_activity_details_loaded', con=connection, if_exists='append', index=False, chunksize=1000)
+        lap_count += len(laps_df)
+        split_count += len(splits_df)
+
+    print(f"Successfully wrote {lap_count} laps and {split_count} splits for {len(load_ids)} activities to MySQL database")
+
+    # Cheap $count answers for the OData service
+    with engine.connect() as connection:
+        total_laps = table_count(connection, 'garmin_connect_activity_laps')
+        total_splits = table_count(connection, 'garmin_connect_activity_splits')
+    publish_entity_counts(engine, {'laps': total_laps, 'splits': total_splits})
+
+except Exception as e:
+    print(f"Error writing to database: {e}")
+    raise
@@ -0,0 +1,143 @@
+"""
+Garmin Activity Page Spool
+
+Local checkpoint store for the ingest script. Every page fetched from Garmin
+Connect is written to its own gzip-compressed NDJSON file (one activity per
+line) before the next page is requested, and manifest.json records which
+pages are complete. A crashed run can then resume from the last completed
+page, and the database load streams the pages back one at a time instead of
+holding every activity in memory.
+
+LAYOUT:
+-------
+<spool dir>/
+    manifest.json            run state (pages fetched with their activityIds,
+                             fetch complete, loaded)
+    page-00000.ndjson.gz     activities 0 - 999
+    page-00001.ndjson.gz     activities 1000 - 1999
+    ...
+
+Pages are fetched by offset and Garmin returns the newest activities first,
+so activities recorded between a crash and the resume shift the later pages:
+the resumed pages can repeat activities that are already spooled. Reading the
+spool back (iter_pages / iter_activities) therefore skips any activityId it
+has already returned.
+
+The spool directory defaults to scheduled_tasks/spool/activities and can be
+overridden with the GARMIN_SPOOL_DIR environment variable.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+DEFAULT_SPOOL_DIR = os.getenv(
+    'GARMIN_SPOOL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool', 'activities')
+)
+
+MANIFEST_NAME = 'manifest.json'
+
+def _write_atomic(path, data):
+    """Write a file so a crash never leaves a partial copy behind"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def new_manifest(page_size):
+    """Manifest for a fresh run"""
+    return {
+        'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'started_at_epoch': time.time(),
+        'page_size': page_size,
+        'pages': [],
+        'fetch_complete': False,
+        'loaded': False,
+    }
+
+def manifest_age_hours(manifest):
+    """Hours since the run in the manifest started"""
+    started = manifest.get('started_at_epoch')
+    if started is None:
+        started = time.mktime(time.strptime(manifest['started_at'], '%Y-%m-%d %H:%M:%S'))
+    return (time.time() - started) / 3600
+
+def spooled_activity_ids(manifest):
+    """activityIds of every spooled page"""
+    return {activity_id for entry in manifest['pages'] for activity_id in entry.get('activity_ids', [])}
+
+def load_manifest(spool_dir=DEFAULT_SPOOL_DIR):
+    """Return the manifest of the run in the spool, or None if there isn't one"""
+    try:
+        with open(os.path.join(spool_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_manifest(manifest, spool_dir=DEFAULT_SPOOL_DIR):
+    _write_atomic(os.path.join(spool_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode('utf-8'))
+
+def clear_spool(spool_dir=DEFAULT_SPOOL_DIR):
+    """Delete the pages and manifest of the previous run"""
+    os.makedirs(spool_dir, exist_ok=True)
+    for name in os.listdir(spool_dir):
+        if name == MANIFEST_NAME or name.endswith('.ndjson.gz'):
+            os.remove(os.path.join(spool_dir, name))
+
+def write_page(manifest, activities, spool_dir=DEFAULT_SPOOL_DIR):
+    """Spool one fetched page and checkpoint it in the manifest"""
+    page = len(manifest['pages'])
+    name = f"page-{page:05d}.ndjson.gz"
+    body = ''.join(json.dumps(activity, separators=(',', ':')) + '\n' for activity in activities)
+    _write_atomic(os.path.join(spool_dir, name), gzip.compress(body.encode('utf-8')))
+
+    # The manifest is only updated once the page file is in place
+    manifest['pages'].append({
+        'page': page,
+        'start': page * manifest['page_size'],
+        'file': name,
+        'count': len(activities),
+        'activity_ids': [activity.get('activityId') for activity in activities],
+    })
+    save_manifest(manifest, spool_dir)
+
+def read_page(entry, spool_dir=DEFAULT_SPOOL_DIR):
+    """Activities (list of dicts) of one spooled page"""
+    with gzip.open(os.path.join(spool_dir, entry['file']), 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def iter_pages(manifest, spool_dir=DEFAULT_SPOOL_DIR):
+    """Yield the activities of each spooled page in order, skipping repeated activityIds"""
+    seen = set()
+    for entry in manifest['pages']:
+        page = []
+        for activity in read_page(entry, spool_dir):
+            activity_id = activity.get('activityId')
+            if activity_id is not None:
+                if activity_id in seen:
+                    continue
+                seen.add(activity_id)
+            page.append(activity)
+        yield page
+
+def iter_activities(manifest, spool_dir=DEFAULT_SPOOL_DIR):
+    """Yield every spooled activity once, in order, one page in memory at a time"""
+    for page in iter_pages(manifest, spool_dir):
+        yield from page
+
+def to_staging_frame(activities):
+    """DataFrame of activities as stored in the staging table (dict/list values as JSON strings)"""
+    activities_df = pd.DataFrame(activities)
+
+    # Convert dict/list columns to JSON strings to avoid insertion errors
+    for col in activities_df.columns:
+        if activities_df[col].apply(lambda x: isinstance(x, (dict, list))).any():
+            activities_df[col] = activities_df[col].apply(
+                lambda x: json.dumps(x) if isinstance(x, (dict, list)) else x
+            )
+    return activities_df
@@ -0,0 +1,84 @@
+"""
+Garmin Connect Login with a Persistent Token Store
+
+Logging in with email/password on every scheduled run is slow, counts against
+Garmin's rate limits and is what eventually triggers
+GarminConnectTooManyRequestsError. garminconnect (via garth) issues OAuth
+tokens that stay valid for months, so they are saved to a local token store
+and reused:
+
+1. Load the tokens from the store and log in with them. garth refreshes the
+   short-lived OAuth2 token from the long-lived OAuth1 token by itself.
+2. If there are no tokens, or they are rejected (expired/revoked), fall back
+   to a full login with GARMIN_EMAIL / GARMIN_PASSWORD.
+3. Save the (possibly refreshed) tokens back to the store.
+
+The token store is a directory (default ~/.garminconnect), overridable with
+the GARMINTOKENS environment variable. It is created readable by the owner
+only, since the tokens grant access to the account.
+"""
+
+import os
+
+from garminconnect import (
+    Garmin,
+    GarminConnectAuthenticationError,
+    GarminConnectTooManyRequestsError,
+    GarminConnectConnectionError
+)
+from garth.exc import GarthHTTPError
+
+DEFAULT_TOKEN_STORE = os.path.expanduser(os.getenv('GARMINTOKENS', '~/.garminconnect'))
+
+def _save_tokens(client, token_store):
+    """Write the client's current tokens to the store (owner-only permissions)"""
+    os.makedirs(token_store, mode=0o700, exist_ok=True)
+    os.chmod(token_store, 0o700)
+    client.garth.dump(token_store)
+
+def login_with_tokens(token_store=DEFAULT_TOKEN_STORE):
+    """Return a client logged in from the token store, or None if the tokens are missing or invalid"""
+    if not os.path.isdir(token_store):
+        return None
+    try:
+        client = Garmin()
+        client.login(token_store)
+    except (FileNotFoundError, GarthHTTPError, GarminConnectAuthenticationError) as e:
+        print(f"Saved Garmin Connect tokens could not be used ({type(e).__name__}), logging in with credentials")
+        return None
+    print("Login successful (saved tokens)!")
+    return client
+
+def login_with_credentials(username, password):
+    """Return a client logged in with email/password, or None if login failed"""
+    try:
+        client = Garmin(username, password)
+        client.login()
+        print("Login successful!")
+        return client
+    except GarminConnectAuthenticationError:
+        print("Authentication error. Check your credentials.")
+    except GarminConnectTooManyRequestsError:
+        print("Too many requests. Try again later.")
+    except GarminConnectConnectionError:
+        print("Connection error. Check your internet connection.")
+    return None
+
+def get_garmin_client(token_store=DEFAULT_TOKEN_STORE):
+    """Logged-in Garmin client (tokens first, credentials as fallback), or None if both fail"""
+    client = login_with_tokens(token_store)
+    if client is None:
+        # Get credentials from environment variables
+        username = os.getenv('GARMIN_EMAIL')
+        password = os.getenv('GARMIN_PASSWORD')
+        print("Using environment variables for Garmin Connect authentication")
+        client = login_with_credentials(username, password)
+        if client is None:
+            return None
+
+    # Persist new or refreshed tokens for the next run
+    try:
+        _save_tokens(client, token_store)
+    except OSError as e:
+        print(f"Could not save Garmin Connect tokens to {token_store}: {e}")
+    return client
@@ -0,0 +1,66 @@
+"""
+OData Entity Counts
+
+Keeps the odata_entity_counts table in step with the tables the ETL loads.
+The Garmin OData service answers $count probes from it (per data version)
+instead of counting every row on each request.
+
+Each load goes:
+1. invalidate_entity_counts()  - delete the entity set's row before the load,
+                                 so the service falls back to counting while
+                                 the table is being rewritten (or if the load
+                                 fails part way)
+2. load the table
+3. publish_entity_counts()     - store the new row count under a new
+                                 data_version
+
+Both steps are skipped with a message if the counts table doesn't exist, so
+the pipeline keeps working without it (the service then always counts).
+
+TABLE:
+------
+CREATE TABLE odata_entity_counts (
+    entity_set VARCHAR(64) NOT NULL PRIMARY KEY,
+    row_count INT NOT NULL,
+    data_version VARCHAR(32) NOT NULL,
+    updated_at DATETIME NOT NULL
+);
+"""
+
+import time
+import uuid
+
+from sqlalchemy import text
+
+COUNTS_TABLE = 'odata_entity_counts'
+
+def invalidate_entity_counts(engine, entity_sets):
+    """Remove the published counts of the entity sets about to be reloaded"""
+    try:
+        with engine.begin() as connection:
+            for entity_set in entity_sets:
+                connection.execute(
+                    text(f"DELETE FROM {COUNTS_TABLE} WHERE entity_set = :entity_set"),
+                    {'entity_set': entity_set}
+                )
+    except Exception as e:
+        print(f"Skipping {COUNTS_TABLE} update: {e}")
+
+def publish_entity_counts(engine, counts):
+    """Store {entity_set: row_count} under a new data version"""
+    data_version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    try:
+        with engine.begin() as connection:
+            for entity_set, row_count in counts.items():
+                connection.execute(
+                    text(
+                        f"INSERT INTO {COUNTS_TABLE} (entity_set, row_count, data_version, updated_at) "
+                        "VALUES (:entity_set, :row_count, :data_version, NOW()) "
+                        "ON DUPLICATE KEY UPDATE row_count = VALUES(row_count), "
+                        "data_version = VALUES(data_version), updated_at = VALUES(updated_at)"
+                    ),
+                    {'entity_set': entity_set, 'row_count': int(row_count), 'data_version': data_version}
+                )
+        print(f"Published entity counts {counts} (data version {data_version})")
+    except Exception as e:
+        print(f"Skipping {COUNTS_TABLE} update: {e}")
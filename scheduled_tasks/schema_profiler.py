@@ -0,0 +1,301 @@
+"""
+Garmin Activities Schema Profiler
+
+Profiles the raw activity columns for DDL generation. All column statistics
+(dtype, nulls, distinct values, string lengths, numeric ranges) are computed
+in one vectorized pass over the DataFrame, optionally on a reservoir sample
+so large histories profile in bounded time and memory. Runs against data that
+is already local - the ingest spool or the staging table - so it doesn't need
+a live Garmin Connect fetch.
+
+USAGE:
+------
+Profile the ingest spool (written by 01 - Ingest Garmin Connect Activities.py):
+    python schema_profiler.py
+
+Profile the staging table, sampling 2,000 rows:
+    python schema_profiler.py --source staging --sample 2000
+
+01 - Ingest Garmin Connect Activities.py --schema-only runs the same profiler
+on the pages it just spooled.
+
+OUTPUT:
+-------
+- activities_schema_analysis.txt   human-readable report (as before)
+- activities_schema_analysis.json  per-column stats, suggested MySQL types and
+                                   a CREATE TABLE statement for DDL generation
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+STAGING_TABLE = 'ingested_garmin_connect_activities'
+
+# Columns with at most this many distinct values have them listed
+MAX_LISTED_UNIQUE_VALUES = 20
+
+# ============================================================================
+# SAMPLING: Uniform sample of a stream of unknown length
+# ============================================================================
+def reservoir_sample(records, size, seed=None):
+    """Return (sample of `size` records, total records seen) - Algorithm R"""
+    rng = random.Random(seed)
+    sample = []
+    seen = 0
+    for record in records:
+        seen += 1
+        if len(sample) < size:
+            sample.append(record)
+        else:
+            j = rng.randrange(seen)
+            if j < size:
+                sample[j] = record
+    return sample, seen
+
+# ============================================================================
+# PROFILING: Column statistics in one pass over the DataFrame
+# ============================================================================
+def _to_python(value):
+    """JSON-serializable version of a pandas/numpy scalar"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+# infer_dtype results that map to a numeric or boolean MySQL type - anything
+# else (strings, mixed values, dates, nested objects) is stored as text
+INTEGER_TYPES = ('integer',)
+FLOAT_TYPES = ('floating', 'mixed-integer-float', 'decimal')
+
+def suggest_sql_type(column, sampled=False):
+    """MySQL column type for a profiled column
+
+    The type comes from every value of the column (inferred_type), not from
+    the first one, and float columns stay DOUBLE even when every value
+    happens to be whole (calories, averageHR, ... are float64 like 325.0).
+    With a sample, the observed ranges and lengths are only lower bounds, so
+    integers get BIGINT and text isn't sized to the longest sampled value.
+    """
+    inferred_type = column['inferred_type']
+    if inferred_type == 'boolean':
+        return 'TINYINT(1)'
+    if inferred_type in INTEGER_TYPES:
+        if not sampled and column['min'] is not None and -2**31 <= column['min'] and column['max'] < 2**31:
+            return 'INT'
+        return 'BIGINT'
+    if inferred_type in FLOAT_TYPES:
+        return 'DOUBLE'
+    if sampled:
+        return 'MEDIUMTEXT' if (column['max_length'] or 0) > 65535 else 'TEXT'
+    max_length = column['max_length'] or 0
+    if max_length <= 255:
+        return 'VARCHAR(255)'
+    if max_length <= 65535:
+        return 'TEXT'
+    return 'MEDIUMTEXT'
+
+def profile_dataframe(df, sampled=False):
+    """Per-column statistics for every column of `df` (a sample of the rows if `sampled`)"""
+    row_count = len(df)
+    not_null = df.notna()
+
+    # Frame-wide reductions - each is a single vectorized call across all columns
+    null_counts = row_count - not_null.sum()
+    unique_counts = df.nunique(dropna=True)
+    first_valid = not_null.to_numpy().argmax(axis=0) if row_count else np.zeros(len(df.columns), dtype=int)
+
+    numeric = df.select_dtypes(include='number')
+    minimums = numeric.min()
+    maximums = numeric.max()
+    integral = ((numeric % 1 == 0) | numeric.isna()).all()
+
+    text = df.select_dtypes(include=['object', 'string'])
+    max_lengths = text.map(lambda value: len(str(value)), na_action='ignore').max()
+    is_json = text.map(
+        lambda value: isinstance(value, str) and value[:1] in ('{', '['), na_action='ignore'
+    ).fillna(False).any()
+
+    columns = []
+    for position, col in enumerate(df.columns):
+        sample_value = df[col].iloc[first_valid[position]] if row_count else None
+        is_numeric = col in numeric.columns
+        column = {
+            'name': col,
+            'pandas_dtype': str(df[col].dtype),
+            'python_type': type(sample_value).__name__,
+            'inferred_type': pd.api.types.infer_dtype(df[col], skipna=True),
+            'null_count': int(null_counts[col]),
+            'null_fraction': float(null_counts[col] / row_count) if row_count else 0.0,
+            'nullable': bool(null_counts[col] > 0),
+            'unique_count': int(unique_counts[col]),
+            'max_length': int(max_lengths[col]) if col in max_lengths.index and pd.notna(max_lengths[col]) else None,
+            'min': _to_python(minimums[col]) if is_numeric and pd.notna(minimums[col]) else None,
+            'max': _to_python(maximums[col]) if is_numeric and pd.notna(maximums[col]) else None,
+            'integral': bool(integral[col]) if is_numeric else False,
+            'is_json': bool(is_json[col]) if col in is_json.index else False,
+            'sample_value': _to_python(sample_value),
+            'unique_values': None,
+        }
+        if column['unique_count'] <= MAX_LISTED_UNIQUE_VALUES and not column['is_json']:
+            column['unique_values'] = [_to_python(v) for v in df[col].dropna().unique()]
+        column['sql_type'] = suggest_sql_type(column, sampled)
+        columns.append(column)
+    return columns
+
+def build_create_table(table, columns, sampled=False):
+    """CREATE TABLE statement from profiled columns
+
+    From a sample, a column without nulls may still have them in the rows
+    that weren't profiled, so every column is left nullable and the
+    statement is flagged with a comment.
+    """
+    definitions = [
+        f"    `{column['name']}` {column['sql_type']}{'' if column['nullable'] or sampled else ' NOT NULL'}"
+        for column in columns
+    ]
+    statement = f"CREATE TABLE `{table}` (\n" + ",\n".join(definitions) + "\n);"
+    if sampled:
+        statement = ("-- Generated from a sample: columns are left nullable and text/integer\n"
+                     "-- types are not sized from the sampled values. Review before use.\n" + statement)
+    return statement
+
+# ============================================================================
+# OUTPUT: Text report and machine-readable JSON
+# ============================================================================
+def write_reports(df, columns, source, total_rows, output_prefix='activities_schema_analysis', table=STAGING_TABLE):
+    """Write <prefix>.txt and <prefix>.json, returning both paths"""
+    sampled = total_rows != len(df)
+    txt_path = f"{output_prefix}.txt"
+    json_path = f"{output_prefix}.json"
+
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        f.write("="*80 + "\n")
+        f.write("DATAFRAME STRUCTURE ANALYSIS\n")
+        f.write("="*80 + "\n\n")
+        f.write(f"Source: {source}\n")
+        f.write(f"Shape: {df.shape}\n")
+        f.write(f"Total Rows: {total_rows}\n")
+        if sampled:
+            f.write(f"Rows Profiled: {len(df)} (reservoir sample - counts are estimates)\n")
+        f.write(f"Total Columns: {len(df.columns)}\n\n")
+
+        f.write("="*80 + "\n")
+        f.write("COLUMN DATA TYPES\n")
+        f.write("="*80 + "\n")
+        f.write(str(df.dtypes) + "\n\n")
+
+        f.write("="*80 + "\n")
+        f.write("DETAILED COLUMN ANALYSIS\n")
+        f.write("="*80 + "\n\n")
+
+        for column in columns:
+            f.write(f"\n{'='*80}\n")
+            f.write(f"Column: {column['name']}\n")
+            f.write(f"{'='*80}\n")
+            f.write(f"Python Type: {column['python_type']}\n")
+            f.write(f"Pandas dtype: {column['pandas_dtype']}\n")
+            f.write(f"Inferred Type: {column['inferred_type']}\n")
+            f.write(f"Null Count: {column['null_count']} ({column['null_fraction']*100:.2f}%)\n")
+            if column['max_length'] is not None:
+                f.write(f"Max Length: {column['max_length']}\n")
+            if column['min'] is not None:
+                f.write(f"Range: {column['min']} to {column['max']}\n")
+            f.write(f"Sample Value: {column['sample_value']}\n")
+            f.write(f"Unique Values: {column['unique_count']}\n")
+            if column['unique_values'] is not None:
+                f.write(f"Unique Values List: {column['unique_values']}\n")
+            f.write(f"Suggested SQL Type: {column['sql_type']}\n")
+
+    report = {
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'source': source,
+        'table': table,
+        'total_rows': total_rows,
+        'rows_profiled': len(df),
+        'sampled': sampled,
+        'columns': columns,
+        'create_table': build_create_table(table, columns, sampled),
+    }
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=str)
+
+    return txt_path, json_path
+
+# ============================================================================
+# SOURCES: Records from the ingest spool or the staging table
+# ============================================================================
+def load_spool(sample_size=None, spool_dir=None, seed=None):
+    """(staging-shaped DataFrame, total rows) from the ingest spool"""
+    from activity_spool import DEFAULT_SPOOL_DIR, iter_activities, load_manifest, to_staging_frame
+
+    spool_dir = spool_dir or DEFAULT_SPOOL_DIR
+    manifest = load_manifest(spool_dir)
+    if manifest is None or not manifest['pages']:
+        raise FileNotFoundError(f"No spooled activities in {spool_dir} - run 01 - Ingest Garmin Connect Activities.py first")
+
+    activities = iter_activities(manifest, spool_dir)
+    if sample_size:
+        records, total_rows = reservoir_sample(activities, sample_size, seed)
+    else:
+        records = list(activities)
+        total_rows = len(records)
+    return to_staging_frame(records), total_rows
+
+def load_staging(sample_size=None, seed=None, chunksize=5000):
+    """(DataFrame, total rows) from the staging table"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from db_connection import get_db_engine
+
+    engine = get_db_engine()
+    query = f"SELECT * FROM {STAGING_TABLE}"
+    if not sample_size:
+        df = pd.read_sql(query, engine)
+        return df, len(df)
+
+    # Stream the table and keep a reservoir of rows
+    def rows():
+        with engine.connect().execution_options(stream_results=True) as connection:
+            for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+                yield from chunk.to_dict('records')
+
+    records, total_rows = reservoir_sample(rows(), sample_size, seed)
+    return pd.DataFrame(records), total_rows
+
+def profile_and_report(df, source, total_rows, output_prefix='activities_schema_analysis'):
+    """Profile `df` and write both reports"""
+    columns = profile_dataframe(df, sampled=total_rows != len(df))
+    txt_path, json_path = write_reports(df, columns, source, total_rows, output_prefix)
+    print(f"Profiled {len(columns)} columns over {len(df)} of {total_rows} rows from {source}")
+    print(f"Schema analysis written to: {txt_path} and {json_path}")
+    return columns
+
+# ============================================================================
+# CLI
+# ============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile Garmin activity columns for DDL generation')
+    parser.add_argument('--source', choices=['spool', 'staging'], default='spool',
+                        help='Profile the ingest spool (default) or the staging table')
+    parser.add_argument('--sample', type=int, default=None,
+                        help='Profile a reservoir sample of this many rows instead of every row')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed for the sample (for repeatable reports)')
+    parser.add_argument('--spool-dir', default=None,
+                        help='Spool directory (default: GARMIN_SPOOL_DIR or scheduled_tasks/spool/activities)')
+    parser.add_argument('--output-prefix', default='activities_schema_analysis',
+                        help='Path prefix of the .txt and .json reports')
+    args = parser.parse_args()
+
+    if args.source == 'spool':
+        df, total_rows = load_spool(args.sample, args.spool_dir, args.seed)
+    else:
+        df, total_rows = load_staging(args.sample, args.seed)
+    profile_and_report(df, args.source, total_rows, args.output_prefix)